@@ -0,0 +1,391 @@
+"""Статистика успеваемости и посещаемости по группе или всему факультету.
+
+Данные берутся из сводок grade_summary и attendance_summary (одна строка на
+пару студент-предмет), загружаются один раз в столбцы array и сворачиваются
+по студентам, предметам и группам взвешенным bincount. При установленном
+numpy свертка выполняется им, без него - тем же алгоритмом на чистом Python.
+Гистограмма оценок в сводке дает среднее, отклонение и процентили без
+чтения отдельных оценок.
+"""
+import argparse
+import json
+import math
+import sys
+from array import array
+
+from database import GROUP_STUDENTS_CONDITION, open_database
+from sharding import ShardedDatabase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GRADES = (5, 4, 3, 2)
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class SummaryColumns:
+    """Сводки группы или факультета, разложенные по столбцам.
+
+    Студенты и предметы пронумерованы подряд; столбцы *_student и *_subject
+    хранят эти номера, а не id из базы.
+    """
+
+    def __init__(self):
+        self.student_ids = []
+        self.student_names = []
+        self.student_groups = array('q')
+        self.group_names = []
+        self.subject_names = []
+
+        self.grade_student = array('q')
+        self.grade_subject = array('q')
+        self.grade_sum = array('q')
+        self.grade_count = array('q')
+        self.grade_square_sum = array('q')
+        self.grade_counts = {grade: array('q') for grade in GRADES}
+
+        self.attendance_student = array('q')
+        self.attendance_subject = array('q')
+        self.present_count = array('q')
+        self.total_count = array('q')
+
+
+def load_columns(db, group_name=None):
+    """Загрузить сводки одной группы (или всех групп, если group_name не задан).
+
+    Для ShardedDatabase группа читается из своего шарда, а факультет -
+    из всех шардов с объединением столбцов.
+    """
+    if isinstance(db, ShardedDatabase):
+        if group_name is not None:
+            shard = db.shard_for_group(group_name)
+            return load_columns(shard, group_name) if shard is not None else SummaryColumns()
+        return merge_columns(db._fan_out(load_columns))
+
+    columns = SummaryColumns()
+    if group_name is None:
+        condition, params = "u.role = 'student'", ()
+    else:
+        condition, params = GROUP_STUDENTS_CONDITION, (group_name,)
+
+    with db.connection() as conn:
+        students = {}
+        groups = {}
+        for student_id, full_name, student_group in conn.execute(f'''
+            SELECT u.id, u.full_name, u.group_name
+            FROM users u
+            WHERE {condition}
+            ORDER BY u.group_name, u.full_name, u.id
+        ''', params):
+            students[student_id] = len(columns.student_ids)
+            columns.student_ids.append(student_id)
+            columns.student_names.append(full_name)
+            if student_group not in groups:
+                groups[student_group] = len(columns.group_names)
+                columns.group_names.append(student_group)
+            columns.student_groups.append(groups[student_group])
+
+        subjects = {}
+        for subject_id, name in conn.execute("SELECT id, name FROM subjects ORDER BY name"):
+            subjects[subject_id] = len(columns.subject_names)
+            columns.subject_names.append(name)
+
+        for student_id, subject_id, grade_sum, grade_count, *counts in conn.execute(f'''
+            SELECT gs.student_id, gs.subject_id, gs.grade_sum, gs.grade_count,
+                   gs.count_5, gs.count_4, gs.count_3, gs.count_2
+            FROM grade_summary gs
+            JOIN users u ON u.id = gs.student_id
+            WHERE {condition}
+        ''', params):
+            columns.grade_student.append(students[student_id])
+            columns.grade_subject.append(subjects[subject_id])
+            columns.grade_sum.append(grade_sum)
+            columns.grade_count.append(grade_count)
+            columns.grade_square_sum.append(sum(grade * grade * count for grade, count in zip(GRADES, counts)))
+            for grade, count in zip(GRADES, counts):
+                columns.grade_counts[grade].append(count)
+
+        for student_id, subject_id, present_count, total_count in conn.execute(f'''
+            SELECT a.student_id, a.subject_id, a.present_count, a.total_count
+            FROM attendance_summary a
+            JOIN users u ON u.id = a.student_id
+            WHERE {condition}
+        ''', params):
+            columns.attendance_student.append(students[student_id])
+            columns.attendance_subject.append(subjects[subject_id])
+            columns.present_count.append(present_count)
+            columns.total_count.append(total_count)
+
+    return columns
+
+
+def merge_columns(parts):
+    """Объединить столбцы нескольких шардов: номера студентов сдвигаются,
+    группы и предметы сопоставляются по названию"""
+    merged = SummaryColumns()
+    groups = {}
+    subjects = {}
+
+    for part in parts:
+        student_offset = len(merged.student_ids)
+        group_map = array('q')
+        for name in part.group_names:
+            if name not in groups:
+                groups[name] = len(merged.group_names)
+                merged.group_names.append(name)
+            group_map.append(groups[name])
+        subject_map = array('q')
+        for name in part.subject_names:
+            if name not in subjects:
+                subjects[name] = len(merged.subject_names)
+                merged.subject_names.append(name)
+            subject_map.append(subjects[name])
+
+        merged.student_ids.extend(part.student_ids)
+        merged.student_names.extend(part.student_names)
+        merged.student_groups.extend(group_map[index] for index in part.student_groups)
+
+        merged.grade_student.extend(index + student_offset for index in part.grade_student)
+        merged.grade_subject.extend(subject_map[index] for index in part.grade_subject)
+        merged.attendance_student.extend(index + student_offset for index in part.attendance_student)
+        merged.attendance_subject.extend(subject_map[index] for index in part.attendance_subject)
+        for name in ('grade_sum', 'grade_count', 'grade_square_sum', 'present_count', 'total_count'):
+            getattr(merged, name).extend(getattr(part, name))
+        for grade in GRADES:
+            merged.grade_counts[grade].extend(part.grade_counts[grade])
+
+    # Порядок групп, студентов и предметов - как при загрузке одной базы
+    order = sorted(range(len(merged.group_names)), key=merged.group_names.__getitem__)
+    renumber = _renumbering(order)
+    merged.group_names = [merged.group_names[index] for index in order]
+    merged.student_groups = array('q', (renumber[index] for index in merged.student_groups))
+
+    order = sorted(range(len(merged.student_ids)), key=lambda index: (
+        merged.student_groups[index], merged.student_names[index], merged.student_ids[index]
+    ))
+    renumber = _renumbering(order)
+    merged.student_ids = [merged.student_ids[index] for index in order]
+    merged.student_names = [merged.student_names[index] for index in order]
+    merged.student_groups = array('q', (merged.student_groups[index] for index in order))
+    merged.grade_student = array('q', (renumber[index] for index in merged.grade_student))
+    merged.attendance_student = array('q', (renumber[index] for index in merged.attendance_student))
+
+    order = sorted(range(len(merged.subject_names)), key=merged.subject_names.__getitem__)
+    renumber = _renumbering(order)
+    merged.subject_names = [merged.subject_names[index] for index in order]
+    merged.grade_subject = array('q', (renumber[index] for index in merged.grade_subject))
+    merged.attendance_subject = array('q', (renumber[index] for index in merged.attendance_subject))
+    return merged
+
+
+def _renumbering(order):
+    """Новые номера элементов после перестановки order"""
+    renumber = array('q', [0]) * len(order)
+    for position, index in enumerate(order):
+        renumber[index] = position
+    return renumber
+
+
+def _bincount(index, weights, size):
+    """Суммы weights по номерам index: список длины size"""
+    if numpy is not None:
+        return numpy.bincount(
+            numpy.frombuffer(index, dtype=numpy.int64),
+            weights=numpy.frombuffer(weights, dtype=numpy.int64),
+            minlength=size
+        ).astype(numpy.int64).tolist()
+
+    totals = [0] * size
+    for position, weight in zip(index, weights):
+        totals[position] += weight
+    return totals
+
+
+def _moments(grade_sum, grade_count, square_sum):
+    """Среднее и стандартное отклонение по сумме, количеству и сумме квадратов"""
+    if not grade_count:
+        return None, None
+    mean = grade_sum / grade_count
+    return mean, math.sqrt(max(square_sum / grade_count - mean * mean, 0.0))
+
+
+def _rate(present, total):
+    return (present / total) * 100 if total else 0
+
+
+def _percentile(values, q):
+    """Процентиль отсортированного списка с линейной интерполяцией (как numpy.percentile)"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _histogram_percentile(distribution, q):
+    """Процентиль оценок по гистограмме {оценка: количество} без развертывания в список"""
+    total = sum(distribution.values())
+    if not total:
+        return None
+
+    position = (total - 1) * q / 100
+    lower = math.floor(position)
+
+    def value_at(rank):
+        seen = 0
+        for grade in sorted(distribution):
+            seen += distribution[grade]
+            if rank < seen:
+                return grade
+        return max(distribution)
+
+    low = value_at(lower)
+    high = value_at(min(lower + 1, total - 1))
+    return low + (high - low) * (position - lower)
+
+
+def compute_statistics(columns):
+    """Свести столбцы в статистику по студентам, предметам, группам и в целом"""
+    student_total = len(columns.student_ids)
+    subject_total = len(columns.subject_names)
+    group_total = len(columns.group_names)
+
+    def by(index, size, *weights):
+        return [_bincount(index, column, size) for column in weights]
+
+    grade_columns = (columns.grade_sum, columns.grade_count, columns.grade_square_sum)
+    attendance_columns = (columns.present_count, columns.total_count)
+
+    student_grades = by(columns.grade_student, student_total, *grade_columns)
+    student_attendance = by(columns.attendance_student, student_total, *attendance_columns)
+    subject_grades = by(columns.grade_subject, subject_total, *grade_columns)
+    subject_attendance = by(columns.attendance_subject, subject_total, *attendance_columns)
+
+    # Группы сворачиваются из итогов студентов
+    student_columns = [array('q', column) for column in student_grades + student_attendance]
+    group_grades = by(columns.student_groups, group_total, *student_columns[:3])
+    group_attendance = by(columns.student_groups, group_total, *student_columns[3:])
+    group_sizes = _bincount(columns.student_groups, array('q', [1]) * student_total, group_total)
+
+    students = []
+    averages = []
+    for index, student_id in enumerate(columns.student_ids):
+        grade_sum, grade_count, square_sum = (column[index] for column in student_grades)
+        mean, std = _moments(grade_sum, grade_count, square_sum)
+        if mean is not None:
+            averages.append(mean)
+        students.append({
+            'student_id': student_id,
+            'full_name': columns.student_names[index],
+            'group_name': columns.group_names[columns.student_groups[index]],
+            'average_grade': mean,
+            'std': std,
+            'total_grades': grade_count,
+            'attendance_rate': _rate(*(column[index] for column in student_attendance)),
+        })
+
+    subjects = []
+    for index, name in enumerate(columns.subject_names):
+        grade_sum, grade_count, square_sum = (column[index] for column in subject_grades)
+        present, total = (column[index] for column in subject_attendance)
+        if not grade_count and not total:
+            continue
+        mean, std = _moments(grade_sum, grade_count, square_sum)
+        subjects.append({
+            'subject': name,
+            'average_grade': mean,
+            'std': std,
+            'total_grades': grade_count,
+            'attendance_rate': _rate(present, total),
+        })
+
+    groups = []
+    for index, name in enumerate(columns.group_names):
+        grade_sum, grade_count, square_sum = (column[index] for column in group_grades)
+        mean, std = _moments(grade_sum, grade_count, square_sum)
+        groups.append({
+            'group_name': name,
+            'students': group_sizes[index],
+            'average_grade': mean,
+            'std': std,
+            'total_grades': grade_count,
+            'attendance_rate': _rate(*(column[index] for column in group_attendance)),
+        })
+
+    distribution = {grade: sum(columns.grade_counts[grade]) for grade in GRADES}
+    total_grades = sum(columns.grade_count)
+    mean, std = _moments(sum(columns.grade_sum), total_grades, sum(columns.grade_square_sum))
+    present, total = sum(columns.present_count), sum(columns.total_count)
+    averages.sort()
+
+    return {
+        'students': students,
+        'subjects': subjects,
+        'groups': groups,
+        'average_grade': mean,
+        'std': std,
+        'total_grades': total_grades,
+        'distribution': distribution,
+        'percentiles': {q: _histogram_percentile(distribution, q) for q in PERCENTILES},
+        'student_average_percentiles': {q: _percentile(averages, q) for q in PERCENTILES},
+        'attendance_rate': _rate(present, total),
+        'total_classes': total,
+    }
+
+
+def collect_statistics(db, group_name=None):
+    """Статистика группы или, без group_name, всего факультета"""
+    return compute_statistics(load_columns(db, group_name))
+
+
+def _format(value, digits=2):
+    return '-' if value is None else f"{value:.{digits}f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Статистика успеваемости по группе или факультету")
+    parser.add_argument('group', nargs='?', help="группа (по умолчанию - весь факультет)")
+    parser.add_argument('--json', action='store_true', help="вывести результат в JSON")
+    parser.add_argument('--db', default="academic_system.db", help="файл базы или каталог шардов")
+    args = parser.parse_args(argv)
+
+    with open_database(args.db, read_only=True) as db:
+        result = collect_statistics(db, args.group)
+
+    if args.json:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return 0
+
+    if not result['total_grades'] and not result['total_classes']:
+        print("Нет данных для статистики.")
+        return 0
+
+    print(f"=== СТАТИСТИКА: {args.group or 'ФАКУЛЬТЕТ'} ===")
+    if not args.group:
+        print("\nГруппы:")
+        for group in result['groups']:
+            print(f"  {group['group_name']}: {group['students']} студентов, средний балл "
+                  f"{_format(group['average_grade'])}, посещаемость {group['attendance_rate']:.1f}%")
+
+    print("\nПредметы:")
+    for subject in result['subjects']:
+        print(f"  {subject['subject']}: {_format(subject['average_grade'])} "
+              f"(σ {_format(subject['std'])}), посещаемость {subject['attendance_rate']:.1f}%")
+
+    print(f"\nСредний балл: {_format(result['average_grade'])} (σ {_format(result['std'])})")
+    print(f"Оценок: {result['total_grades']}, распределение: "
+          + ", ".join(f"{grade}: {count}" for grade, count in result['distribution'].items()))
+    print("Процентили оценок: "
+          + ", ".join(f"p{q} {_format(value)}" for q, value in result['percentiles'].items()))
+    print("Процентили средних баллов студентов: "
+          + ", ".join(f"p{q} {_format(value)}" for q, value in result['student_average_percentiles'].items()))
+    print(f"Посещаемость: {result['attendance_rate']:.1f}% ({result['total_classes']} занятий)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Архивирование закрытых семестров.
+
+Оценки и посещаемость закрытого семестра переносятся из живых таблиц в
+архивный файл рядом с базой (archive/<база>_<учебный год>.db, один файл
+на учебный год) и записываются в реестр archives. Живые таблицы и сводки
+после этого содержат только незакрытые семестры, поэтому обычные запросы
+(текущие оценки, посещаемость, статистика) архивы не читают. Отчеты по
+всем семестрам строятся через Database.history(), которая подключает
+архивы через ATTACH и объединяет их с живыми таблицами представлениями.
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime
+
+from database import open_database
+from migrations import ARCHIVED_TABLES, upgrade_archive
+from models import day_label, day_number
+from sharding import ShardedDatabase
+
+# Каталог архивов относительно каталога базы
+ARCHIVE_DIR = "archive"
+
+
+def term_of(day):
+    """Семестр даты: '2023-2024-1' (осенний, с 1 сентября) или '2023-2024-2' (весенний, с 1 февраля)"""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    if day.month >= 9:
+        return f"{day.year}-{day.year + 1}-1"
+    if day.month == 1:
+        return f"{day.year - 1}-{day.year}-1"
+    return f"{day.year - 1}-{day.year}-2"
+
+
+def term_bounds(term):
+    """Границы семестра (начало, конец) в формате YYYY-MM-DD, конец не включается"""
+    first_year, second_year, number = term.split('-')
+    if number == '1':
+        return f"{first_year}-09-01", f"{second_year}-02-01"
+    if number == '2':
+        return f"{second_year}-02-01", f"{second_year}-09-01"
+    raise ValueError(f"Неизвестный семестр: {term}")
+
+
+def next_term(term):
+    first_year, second_year, number = term.split('-')
+    if number == '1':
+        return f"{first_year}-{second_year}-2"
+    return f"{second_year}-{int(second_year) + 1}-1"
+
+
+def archive_term(db, term, directory=ARCHIVE_DIR, today=None):
+    """Перенести оценки и посещаемость семестра term в архивный файл.
+
+    Перенос идет в две транзакции: строки копируются в архив, затем
+    удаляются из живых таблиц - только те, что уже есть в архиве.
+    Прерванный перенос можно просто повторить, повторный запуск также
+    дописывает строки, добавленные в закрытый семестр задним числом.
+    Возвращает (число оценок, число отметок посещаемости).
+    """
+    start, end = term_bounds(term)
+    if end > term_bounds(term_of(today or date.today()))[0]:
+        raise ValueError(f"Семестр {term} еще не закрыт")
+
+    stem = os.path.splitext(os.path.basename(db.db_name))[0]
+    relative_path = os.path.join(directory, f"{stem}_{term.rsplit('-', 1)[0]}.db")
+    path = db.archive_path(relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    days = (day_number(start), day_number(end))
+    with db.connection() as conn:
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            upgrade_archive(conn, 'archive')
+
+            conn.execute("BEGIN IMMEDIATE")
+            for table, columns in ARCHIVED_TABLES.items():
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table}
+                    WHERE date >= ? AND date < ?
+                ''', days)
+            conn.commit()
+
+            conn.execute("BEGIN IMMEDIATE")
+            moved = {}
+            for table in ARCHIVED_TABLES:
+                # Триггеры сводных таблиц вычитают удаленные строки: сводки остаются по живому разделу
+                moved[table] = conn.execute(f'''
+                    DELETE FROM main.{table}
+                    WHERE date >= ? AND date < ? AND id IN (SELECT id FROM archive.{table})
+                ''', days).rowcount
+            conn.execute('''
+                INSERT INTO archives (term, path, start_date, end_date, grades, attendance, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (term) DO UPDATE SET
+                    grades = grades + excluded.grades,
+                    attendance = attendance + excluded.attendance,
+                    archived_at = excluded.archived_at
+            ''', (term, relative_path, start, end, moved['grades'], moved['attendance'],
+                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("DETACH DATABASE archive")
+
+    db.clear_report_cache()
+    return moved['grades'], moved['attendance']
+
+
+def archive_closed_terms(db, before=None, directory=ARCHIVE_DIR):
+    """Перенести в архивы все семестры, закончившиеся до семестра даты before (по умолчанию - сегодня).
+
+    Возвращает {семестр: (оценок, отметок)} по семестрам, где что-то перенесено.
+    Для ShardedDatabase архивируется каждый шард.
+    """
+    before = before or date.today()
+    if isinstance(db, ShardedDatabase):
+        archived = {}
+        for _, shard in db.shards():
+            for term, (grades, attendance) in archive_closed_terms(shard, before, directory).items():
+                total_grades, total_attendance = archived.get(term, (0, 0))
+                archived[term] = (total_grades + grades, total_attendance + attendance)
+        return archived
+
+    with db.connection() as conn:
+        oldest = [
+            day for day in (conn.execute(f"SELECT MIN(date) FROM {table}").fetchone()[0] for table in ARCHIVED_TABLES)
+            if day is not None
+        ]
+
+    archived = {}
+    if not oldest:
+        return archived
+
+    current = term_of(before)
+    term = term_of(day_label(min(oldest)))
+    while term_bounds(term)[0] < term_bounds(current)[0]:
+        moved = archive_term(db, term, directory, before)
+        if any(moved):
+            archived[term] = moved
+        term = next_term(term)
+    return archived
+
+
+def _print_archives(db):
+    shards = db.shards() if isinstance(db, ShardedDatabase) else [(None, db)]
+    for _, shard in shards:
+        for archive in shard.get_archives():
+            print(f"{archive['term']}: {archive['start_date']} - {archive['end_date']}, "
+                  f"оценок: {archive['grades']}, отметок: {archive['attendance']}, "
+                  f"файл: {shard.archive_path(archive['path'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перенос закрытых семестров в архивные файлы")
+    parser.add_argument('--before', type=date.fromisoformat,
+                        help="архивировать семестры, закончившиеся до семестра этой даты (YYYY-MM-DD, "
+                             "по умолчанию - до текущего)")
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help="каталог архивов относительно каталога базы")
+    parser.add_argument('--list', action='store_true', help="только показать реестр архивов")
+    parser.add_argument('--db', default="academic_system.db", help="файл базы или каталог шардов")
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    try:
+        if not args.list:
+            archived = archive_closed_terms(db, args.before, args.dir)
+            for term, (grades, attendance) in archived.items():
+                print(f"Семестр {term}: перенесено оценок {grades}, отметок посещаемости {attendance}")
+            if not archived:
+                print("Закрытых семестров в живых таблицах нет")
+        _print_archives(db)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,9 @@
-from database import Database
+from database import get_database
 
 
 class AuthSystem:
     def __init__(self):
-        self.db = Database()
+        self.db = get_database()
         self.current_user = None
 
     def login(self):
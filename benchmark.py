@@ -0,0 +1,350 @@
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import analytics
+from database import Database
+from headman_interface import HeadmanInterface
+from models import day_number
+from reports import cached_group_report, open_report, read_group_report, write_group_delta, write_group_report
+from student_interface import StudentInterface
+
+# Размеры синтетической базы: группы, студентов в группе, предметов, учебных лет
+SIZES = {
+    'small': {'groups': 2, 'students': 25, 'subjects': 5, 'years': 1},
+    'medium': {'groups': 5, 'students': 30, 'subjects': 8, 'years': 2},
+    'large': {'groups': 10, 'students': 30, 'subjects': 10, 'years': 4},
+}
+
+# Занятий и оценок по одному предмету за учебный год
+LESSONS_PER_YEAR = 32
+GRADES_PER_YEAR = 10
+
+# Методы Database, которые не замеряются: служебные и жизненного цикла
+NOT_BENCHMARKED = {'get_connection', 'connection', 'close', 'init_database', 'seed_test_data', 'add_subject',
+                   'enable_write_behind', 'disable_write_behind', 'flush', 'clear_report_cache', 'archive_path',
+                   'enable_instrumentation', 'disable_instrumentation', 'restore_dropped_structures'}
+
+
+def generate(db_path, groups, students, subjects, years, seed=0):
+    """Заполнить новую базу детерминированными синтетическими данными"""
+    rng = random.Random(seed)
+    db = Database(db_path)
+
+    for number in range(len(db.get_subjects()), subjects):
+        db.add_subject(f"Предмет {number + 1}")
+    subject_ids = [db.get_subject_id(name) for name in db.get_subjects()[:subjects]]
+
+    users = []
+    for group in range(groups):
+        group_name = f"Группа {101 + group}"
+        users.append((f"headman{group + 1}", '123456', f"Староста {group + 1}", 'headman', group_name))
+        for number in range(students):
+            users.append((
+                f"student{group + 1}_{number + 1}", '123456',
+                f"Студент {rng.randrange(10 ** 6):06d} {number + 1}", 'student', group_name
+            ))
+
+    start = date(2024 - years, 9, 1)
+    lesson_days = [start + timedelta(days=day) for day in range(years * 365)]
+    lesson_days = [day for day in lesson_days if day.weekday() < 5]
+
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO users (username, password, full_name, role, group_name)
+            VALUES (?, ?, ?, ?, ?)
+        ''', users)
+        student_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'student'")]
+
+        for student_id in student_ids:
+            grades = []
+            attendance = []
+            for subject_id in subject_ids:
+                for day in sorted(rng.sample(lesson_days, LESSONS_PER_YEAR * years)):
+                    attendance.append((student_id, subject_id, day_number(day), rng.random() < 0.85))
+                for day in sorted(rng.sample(lesson_days, GRADES_PER_YEAR * years)):
+                    grades.append((student_id, subject_id, rng.choice((2, 3, 3, 4, 4, 4, 5, 5, 5)),
+                                   day_number(day), f"Преподаватель {subject_id}"))
+
+            conn.executemany('''
+                INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
+                VALUES (?, ?, ?, ?, ?)
+            ''', grades)
+            conn.executemany('''
+                INSERT INTO attendance (student_id, subject_id, date, present)
+                VALUES (?, ?, ?, ?)
+            ''', attendance)
+
+        conn.commit()
+
+    return db
+
+
+def _quiet(function):
+    """Выполнить интерфейсный метод без вывода на экран"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+    return run
+
+
+def _cold(db, function):
+    """Замер без кэша отчетов"""
+    def run():
+        db.student_cache.clear()
+        function()
+    return run
+
+
+def build_cases(db, workdir):
+    with db.connection() as conn:
+        student_id, username, group_name = conn.execute(
+            "SELECT id, username, group_name FROM users WHERE role = 'student' ORDER BY id LIMIT 1"
+        ).fetchone()
+        headman_id = conn.execute(
+            "SELECT id FROM users WHERE role = 'headman' AND group_name = ?", (group_name,)
+        ).fetchone()[0]
+        group_student_ids = [row[0] for row in db.get_group_students(group_name)]
+        # Период для выборок по датам: последние 120 дней истории
+        period_end = conn.execute("SELECT MAX(date) FROM attendance").fetchone()[0] or day_number(date.today())
+        period_start = period_end - 120
+        # Выгрузка изменений: последние 200 записей журнала
+        delta_after = max(conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0] - 200, 0)
+
+    subject = db.get_subjects()[0]
+
+    student_interface = StudentInterface(student_id, group_name, db)
+    headman_interface = HeadmanInterface(headman_id, group_name, db)
+
+    def write_report(report_format):
+        def run():
+            with open_report(os.path.join(workdir, f"report.{report_format}"), report_format) as f:
+                write_group_report(db, group_name, f, report_format)
+        return run
+
+    def write_delta(report_format):
+        def run():
+            with open(os.path.join(workdir, f"delta.{report_format}"), 'w', encoding='utf-8') as f:
+                write_group_delta(db, group_name, f, delta_after, report_format)
+        return run
+
+    def in_snapshot(function):
+        def run():
+            with db.snapshot():
+                function()
+        return run
+
+    def in_workdir(function):
+        def run():
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                function()
+            finally:
+                os.chdir(cwd)
+        return run
+
+    return {
+        'authenticate_user': lambda: db.authenticate_user(username, '123456'),
+        'get_student_grades': lambda: db.get_student_grades(student_id),
+        'get_student_attendance': lambda: db.get_student_attendance(student_id),
+        'get_student_grades[range]': lambda: db.get_student_grades(
+            student_id, start=period_start, end=period_end),
+        'get_student_attendance[range]': lambda: db.get_student_attendance(
+            student_id, start=period_start, end=period_end),
+        'get_student_grades[archive]': lambda: db.get_student_grades(student_id, include_archive=True),
+        'get_student_attendance[archive]': lambda: db.get_student_attendance(student_id, include_archive=True),
+        'get_student_grades_page': lambda: db.get_student_grades_page(student_id, 10),
+        'get_student_attendance_page': lambda: db.get_student_attendance_page(student_id, 10),
+        'get_student_attendance_totals': lambda: db.get_student_attendance_totals(student_id),
+        'get_group_names': db.get_group_names,
+        'get_group_students': lambda: db.get_group_students(group_name),
+        'get_group_grades_page': lambda: db.get_group_grades_page(group_name, 10),
+        'get_group_grades': lambda: db.get_group_grades(group_name),
+        'get_group_grades[range]': lambda: db.get_group_grades(group_name, period_start, period_end),
+        'get_attendance_trend': lambda: db.get_attendance_trend('week', student_id=student_id),
+        'get_attendance_trend[group]': lambda: db.get_attendance_trend('month', group_name=group_name),
+        'get_attendance_trend[subject]': lambda: db.get_attendance_trend(
+            'month', subject=subject, start=period_start, end=period_end),
+        'get_attendance_trend[faculty]': lambda: db.get_attendance_trend(
+            'week', start=period_start, end=period_end),
+        'get_student_subject_averages': lambda: db.get_student_subject_averages(student_id),
+        'get_group_grade_statistics': lambda: db.get_group_grade_statistics(group_name),
+        'add_grade': lambda: db.add_grade(student_id, subject, 5, 'Бенчмарк'),
+        'add_attendance': lambda: db.add_attendance(student_id, subject, True),
+        'submit_grade': lambda: db.submit_grade(student_id, subject, 5, 'Бенчмарк').result(),
+        'submit_attendance': lambda: db.submit_attendance(student_id, subject, True).result(),
+        'add_grades_batch': lambda: db.add_grades_batch(
+            (sid, subject, 4, 'Бенчмарк') for sid in group_student_ids),
+        'add_attendance_batch': lambda: db.add_attendance_batch(
+            (sid, subject, True) for sid in group_student_ids),
+        'get_subjects': db.get_subjects,
+        'get_subject_id': lambda: db.get_subject_id(subject),
+        'refresh_subjects': db.refresh_subjects,
+        'get_student_detailed_info': _cold(db, lambda: db.get_student_detailed_info(student_id)),
+        'get_student_detailed_info[cached]': lambda: db.get_student_detailed_info(student_id),
+        'get_group_detailed_info': _cold(db, lambda: db.get_group_detailed_info(group_name)),
+        'get_group_detailed_info[cached]': lambda: db.get_group_detailed_info(group_name),
+        'get_group_detailed_info[range]': lambda: db.get_group_detailed_info(
+            group_name, start=period_start, end=period_end),
+        'get_groups_detailed_info': _cold(db, db.get_groups_detailed_info),
+        'snapshot': in_snapshot(lambda: db.get_group_detailed_info(group_name)),
+        'backup': lambda: db.backup(os.path.join(workdir, "backup.db")),
+        'get_archives': db.get_archives,
+        'get_student_detailed_info[archive]': lambda: db.get_student_detailed_info(student_id, include_archive=True),
+        'history': lambda: db.get_group_detailed_info(group_name, include_archive=True),
+        'get_group_delta': lambda: db.get_group_delta(group_name, delta_after),
+        'get_group_delta[full]': lambda: db.get_group_delta(group_name),
+        'get_watermark': lambda: db.get_watermark('benchmark', group_name),
+        'set_watermark': lambda: db.set_watermark('benchmark', group_name, delta_after),
+        'iter_group_student_reports': lambda: sum(1 for _ in db.iter_group_student_reports(group_name)),
+        'rebuild_summaries': db.rebuild_summaries,
+        'StudentInterface.generate_json_report': _cold(db, in_workdir(_quiet(student_interface.generate_json_report))),
+        'HeadmanInterface.generate_group_json_report': _cold(
+            db, in_workdir(_quiet(headman_interface.generate_group_json_report))),
+        'write_group_report[json]': write_report('json'),
+        'write_group_report[jsonl]': write_report('jsonl'),
+        'write_group_report[jsonl.gz]': write_report('jsonl.gz'),
+        'read_group_report[jsonl.gz]': lambda: read_group_report(os.path.join(workdir, "report.jsonl.gz")),
+        'get_group_version': lambda: db.get_group_version(group_name),
+        'get_database_id': db.get_database_id,
+        'cached_group_report': lambda: cached_group_report(
+            db, group_name, 'jsonl.gz', os.path.join(workdir, "report_cache")),
+        'write_group_delta[jsonl]': write_delta('jsonl'),
+        'analytics.collect_statistics': lambda: analytics.collect_statistics(db, group_name),
+        'analytics.collect_statistics[faculty]': lambda: analytics.collect_statistics(db),
+    }
+
+
+def untimed_methods(cases):
+    """Публичные методы Database, для которых нет замера"""
+    covered = {name.split('[')[0] for name in cases}
+    public = {
+        name for name, member in inspect.getmembers(Database, inspect.isfunction)
+        if not name.startswith('_')
+    }
+    return sorted(public - covered - NOT_BENCHMARKED)
+
+
+def measure(function, repeat):
+    function()  # прогрев
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - begin) * 1000)
+
+    return {
+        'runs': len(timings),
+        'min_ms': round(min(timings), 4),
+        'median_ms': round(statistics.median(timings), 4),
+        'mean_ms': round(statistics.fmean(timings), 4),
+    }
+
+
+def run_benchmarks(sizes, repeat, seed=0):
+    results = {}
+    untimed = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            params = SIZES[size]
+            db_path = os.path.join(workdir, f"bench_{size}.db")
+
+            started = time.perf_counter()
+            db = generate(db_path, seed=seed, **params)
+            generated = time.perf_counter() - started
+
+            with db.connection() as conn:
+                rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        for table in ('users', 'grades', 'attendance')}
+
+            print(f"[{size}] сгенерировано за {generated:.1f} с: {rows}", file=sys.stderr)
+
+            cases = build_cases(db, workdir)
+            untimed = untimed_methods(cases)
+            results[size] = {'params': params, 'rows': rows, 'cases': {}}
+            for name, function in cases.items():
+                results[size]['cases'][name] = measure(function, repeat)
+                print(f"  {name}: {results[size]['cases'][name]['median_ms']:.3f} мс", file=sys.stderr)
+
+            db.close()
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'untimed_methods': untimed,
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Список регрессий: медиана выросла больше чем на threshold относительно базовой"""
+    regressions = []
+    for size, data in current['results'].items():
+        base_cases = baseline.get('results', {}).get(size, {}).get('cases', {})
+        for name, timing in data['cases'].items():
+            base = base_cases.get(name)
+            if base is None or base['median_ms'] <= 0:
+                continue
+            ratio = timing['median_ms'] / base['median_ms']
+            if ratio > 1 + threshold:
+                regressions.append((size, name, base['median_ms'], timing['median_ms'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры методов Database на синтетических данных")
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=20, help="число замеров на метод")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="сохранить результаты в JSON")
+    parser.add_argument('--compare', metavar='BASELINE', help="сравнить с сохраненными результатами")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="допустимое относительное замедление медианы (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.seed)
+
+    if results['untimed_methods']:
+        print(f"Нет замеров для: {', '.join(results['untimed_methods'])}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+        for size, name, before, after, ratio in regressions:
+            print(f"РЕГРЕССИЯ [{size}] {name}: {before:.3f} -> {after:.3f} мс (x{ratio:.2f})", file=sys.stderr)
+        if regressions:
+            return 1
+        print("Регрессий не обнаружено.", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
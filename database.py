@@ -1,78 +1,352 @@
+import atexit
+import inspect
+import os
 import sqlite3
-from datetime import datetime
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime
+from urllib.request import pathname2url
 import json
 
+from cache import LRUCache
+from instrumentation import Instrumentation
+from migrations import ARCHIVED_TABLES, SCHEMA_VERSION, migrate, rebuild_summaries, schema_version, upgrade_archive
+from models import (AttendanceChangeRecord, AttendanceRecord, AttendanceTrendRecord, GradeChangeRecord, GradeRecord,
+                    GroupGradeRecord, GroupStatistics, attendance_columns, day_label, day_number, grade_columns, group_grade_columns, intern_label)
+from pool import ConnectionPool
+from write_queue import WriteBehindQueue
+
+# Условие на users u, выбирающее студентов группы
+GROUP_STUDENTS_CONDITION = "u.group_name = ? AND u.role = 'student'"
+
+# Начало периода тренда посещаемости по номеру дня a.date: недели с понедельника
+# (1970-01-01 - четверг), месяцы с первого числа
+TREND_PERIODS = {
+    'week': "a.date - (a.date + 3) % 7",
+    'month': "CAST(julianday(a.date * 86400, 'unixepoch', 'start of month') - 2440587.5 AS INTEGER)",
+}
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+# База по умолчанию для get_database(); main.py --db меняет ее на время работы программы
+DEFAULT_DB_NAME = "academic_system.db"
+
+
+def open_database(db_name, **options):
+    """Database над файлом или ShardedDatabase над каталогом шардов (см. sharding.py)"""
+    if os.path.isdir(db_name):
+        # sharding импортирует этот модуль, поэтому импорт здесь, а не в начале файла
+        from sharding import ShardedDatabase
+        return ShardedDatabase(db_name, **options)
+    return Database(db_name, **options)
+
+
+def get_database(db_name=None):
+    """Общий для всего процесса экземпляр Database"""
+    db_name = db_name or DEFAULT_DB_NAME
+    with _shared_lock:
+        db = _shared.get(db_name)
+        if db is None or db.closed:
+            if not _shared:
+                atexit.register(close_shared_databases)
+            db = _shared[db_name] = open_database(db_name)
+            # Профилирование включается переменной окружения с путем для снимка статистики
+            if os.environ.get('ACADEMIC_PROFILE'):
+                db.enable_instrumentation(
+                    slow_query_ms=float(os.environ.get('ACADEMIC_SLOW_QUERY_MS', 100)),
+                    dump_path=os.environ['ACADEMIC_PROFILE']
+                )
+        return db
+
+
+def close_shared_databases():
+    with _shared_lock:
+        for db in _shared.values():
+            db.close()
+        _shared.clear()
+
+
+# Настройки соединения: WAL позволяет читателям не блокировать писателя
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('mmap_size', 64 * 1024 * 1024),
+    ('busy_timeout', 5000),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def connect(db_name, read_only=False, factory=sqlite3.Connection):
+    """Открыть соединение SQLite с настройками PRAGMAS"""
+    if read_only:
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_name))}?mode=ro", uri=True,
+                               check_same_thread=False, factory=factory)
+    else:
+        conn = sqlite3.connect(db_name, check_same_thread=False, factory=factory)
+
+    for name, value in PRAGMAS:
+        # Режим журнала меняет файл базы - это делают только пишущие соединения
+        if not (read_only and name == 'journal_mode'):
+            conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def _is_int(value):
+    """Целое число, но не bool (bool - подкласс int)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
 
 class Database:
-    def __init__(self, db_name="academic_system.db"):
+    PRAGMAS = PRAGMAS
+
+    # Методы, которые не оборачиваются замером времени
+    NOT_INSTRUMENTED = ('connection', 'get_connection', 'close', 'enable_instrumentation', 'disable_instrumentation',
+                        'enable_write_behind', 'disable_write_behind')
+
+    def __init__(self, db_name="academic_system.db", pool_size=5, seed=False, report_cache_size=1024,
+                 instrumentation=None, read_only=False, write_behind=False):
         self.db_name = db_name
-        self.init_database()
+        # Только чтение: соединения открываются в mode=ro, схема не проверяется и не обновляется
+        self.read_only = read_only
+        self.instrumentation = None
+        self.write_queue = None
+        self.pool = ConnectionPool(self.get_connection, size=pool_size)
+        self._subjects = None
+        self._database_id = None
+        # Готовые сводки по студентам с версией данных студента, при которой они построены;
+        # сбрасываются при записи через этот экземпляр, записи других - видны по версии
+        self.student_cache = LRUCache(maxsize=report_cache_size)
+        # Счетчик сбросов кэша: отчет, построенный до записи, в кэш не попадает
+        self._cache_epoch = 0
+        self._cache_lock = threading.Lock()
+        self._snapshot_state = threading.local()
+        if instrumentation is not None:
+            self.enable_instrumentation(instrumentation)
+        if not read_only:
+            self.init_database()
+        if seed:
+            self.seed_test_data()
+        if write_behind:
+            self.enable_write_behind(**(write_behind if isinstance(write_behind, dict) else {}))
 
     def get_connection(self):
-        return sqlite3.connect(self.db_name)
+        """Открыть новое настроенное соединение (используется пулом)"""
+        factory = self.instrumentation.connection_class if self.instrumentation else sqlite3.Connection
+        return connect(self.db_name, self.read_only, factory)
 
-    def init_database(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def connection(self):
+        """Взять соединение из пула: with db.connection() as conn: ..."""
+        return self.pool.connection()
 
-        # Таблица пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                full_name TEXT NOT NULL,
-                role TEXT NOT NULL,
-                group_name TEXT NOT NULL
-            )
-        ''')
+    @contextmanager
+    def snapshot(self):
+        """Снимок базы на момент входа: with db.snapshot() as conn: ...
 
-        # Таблица предметов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subjects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL
-            )
-        ''')
-
-        # Таблица оценок
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS grades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL,
-                subject_id INTEGER NOT NULL,
-                grade INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                teacher_name TEXT NOT NULL,
-                FOREIGN KEY (student_id) REFERENCES users (id),
-                FOREIGN KEY (subject_id) REFERENCES subjects (id)
-            )
-        ''')
-
-        # Таблица посещаемости
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL,
-                subject_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                present BOOLEAN NOT NULL,
-                FOREIGN KEY (student_id) REFERENCES users (id),
-                FOREIGN KEY (subject_id) REFERENCES subjects (id)
-            )
-        ''')
+        Все чтения в этом потоке внутри блока идут в одной читающей
+        транзакции и видят одно и то же состояние базы, даже если другие
+        соединения в это время фиксируют записи. В режиме WAL такая
+        транзакция не мешает писателям. Отчеты из кэша внутри снимка
+        берутся, только если построены при той же версии данных студента.
+        """
+        state = self._snapshot_state
+        with self.connection() as conn:
+            if getattr(state, 'active', False):
+                yield conn
+                return
 
-        # Добавляем основные предметы
-        subjects = [
-            'Математика', 'Физика', 'Программирование',
-            'Английский язык', 'История'
-        ]
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            # Снимок WAL фиксируется первым чтением, а не командой BEGIN
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            state.active = True
+            try:
+                yield conn
+            finally:
+                state.active = False
 
-        for subject in subjects:
-            cursor.execute(
-                "INSERT OR IGNORE INTO subjects (name) VALUES (?)",
-                (subject,)
-            )
+    @property
+    def in_snapshot(self):
+        return getattr(self._snapshot_state, 'active', False)
+
+    def backup(self, path):
+        """Скопировать базу в файл path на один момент времени (backup API sqlite3).
+
+        Копия делается за один шаг и не блокирует писателей в режиме WAL;
+        у копии обычный журнал, ее можно открывать и только для чтения.
+        """
+        target = sqlite3.connect(path)
+        try:
+            with self.connection() as conn:
+                conn.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+
+    def get_archives(self):
+        """Реестр архивных семестров в порядке дат: список словарей (см. archive.py)"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                SELECT term, path, start_date, end_date, grades, attendance, archived_at
+                FROM archives
+                ORDER BY start_date
+            ''')
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def archive_path(self, path):
+        """Путь к архивному файлу; относительные пути в реестре отсчитываются от каталога базы"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_name)), path)
+
+    @contextmanager
+    def history(self):
+        """Живые данные вместе с архивами: with db.history() as conn: ...
+
+        К соединению подключаются (ATTACH) архивные файлы из реестра и
+        создаются временные представления all_grades и all_attendance -
+        UNION ALL живой таблицы и ее архивных разделов. Внутри блока
+        соединение только читает, все чтения идут в одном снимке (см.
+        snapshot). Без этого блока запросы видят только живой раздел.
+        """
+        state = self._snapshot_state
+        if getattr(state, 'history', False):
+            with self.connection() as conn:
+                yield conn
+            return
+        if self.in_snapshot:
+            # ATTACH невозможен внутри открытой транзакции
+            raise sqlite3.OperationalError("Архивы нельзя подключить внутри snapshot()")
+
+        # Архив одного учебного года лежит в одном файле: SQLite подключает не больше 10 баз
+        paths = list(dict.fromkeys(self.archive_path(archive['path']) for archive in self.get_archives()))
+
+        with self.connection() as conn:
+            schemas = ['main']
+            try:
+                for number, path in enumerate(paths):
+                    conn.execute(f"ATTACH DATABASE ? AS archive_{number}", (path,))
+                    schemas.append(f"archive_{number}")
+                    if not self.read_only:
+                        upgrade_archive(conn, f"archive_{number}")
+
+                for table, columns in ARCHIVED_TABLES.items():
+                    conn.execute(f"CREATE TEMP VIEW all_{table} AS " + " UNION ALL ".join(
+                        f"SELECT {columns} FROM {schema}.{table}" for schema in schemas
+                    ))
+
+                state.history = True
+                with self.snapshot():
+                    yield conn
+            finally:
+                state.history = False
+                if conn.in_transaction:
+                    conn.rollback()
+                for table in ARCHIVED_TABLES:
+                    conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+                for schema in schemas[1:]:
+                    conn.execute(f"DETACH DATABASE {schema}")
+
+    def _reader(self, include_archive):
+        return self.history() if include_archive else self.connection()
+
+    def close(self):
+        self.disable_write_behind()
+        self.pool.close()
+
+    @property
+    def closed(self):
+        return self.pool.closed
+
+    def enable_instrumentation(self, instrumentation=None, **options):
+        """Включить сбор статистики по методам и запросам.
+
+        options передаются в Instrumentation (slow_query_ms, dump_path).
+        Статистика доступна через db.instrumentation.snapshot() и dump().
+        """
+        self.disable_instrumentation()
+        self.instrumentation = instrumentation or Instrumentation(**options)
+
+        for name, _ in inspect.getmembers(type(self), inspect.isfunction):
+            if not name.startswith('_') and name not in self.NOT_INSTRUMENTED:
+                setattr(self, name, self.instrumentation.wrap_method(name, getattr(self, name)))
+
+        self._reset_pool()
+        return self.instrumentation
+
+    def disable_instrumentation(self):
+        if self.instrumentation is None:
+            return
+
+        for name in list(vars(self)):
+            if callable(getattr(type(self), name, None)):
+                delattr(self, name)
+
+        self.instrumentation = None
+        self._reset_pool()
+
+    def enable_write_behind(self, max_batch=256, max_delay=0.0):
+        """Включить групповую фиксацию записи оценок и посещаемости.
+
+        add_grade/add_attendance и submit_* ставят вставку в очередь; один
+        поток-писатель фиксирует накопившиеся вставки общей транзакцией
+        (до max_batch штук; max_delay - сколько секунд ждать добора пачки,
+        по умолчанию берется то, что накопилось за предыдущий COMMIT). Вместо
+        конкуренции за блокировку записи SQLite вызовы ждут общий COMMIT.
+        """
+        if self.read_only:
+            raise sqlite3.OperationalError("База открыта только для чтения")
+        if self.write_queue is None:
+            self.write_queue = WriteBehindQueue(self._write_operations, max_batch, max_delay)
+            # Оставшиеся в очереди вставки записываются при завершении программы
+            atexit.register(self.disable_write_behind)
+        return self.write_queue
+
+    def disable_write_behind(self):
+        """Записать все, что стоит в очереди, и вернуться к синхронной записи"""
+        if self.write_queue is None:
+            return
+        self.write_queue.close()
+        self.write_queue = None
+        atexit.unregister(self.disable_write_behind)
+
+    def flush(self, timeout=None):
+        """Дождаться фиксации всех поставленных в очередь вставок"""
+        if self.write_queue is not None:
+            self.write_queue.flush(timeout)
+
+    def _reset_pool(self):
+        # Соединения пересоздаются с нужным классом при следующем обращении
+        old_pool = self.pool
+        self.pool = ConnectionPool(self.get_connection, size=old_pool.size)
+        old_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def init_database(self):
+        with self.connection() as conn:
+            # Уже инициализированная база открывается без единой записи
+            if schema_version(conn) < SCHEMA_VERSION:
+                migrate(conn)
+            pending = conn.execute("SELECT EXISTS (SELECT 1 FROM dropped_structures)").fetchone()[0]
+
+        # Загрузка с --rebuild-indexes была прервана и не вернула индексы
+        if pending:
+            self.restore_dropped_structures()
+
+    def seed_test_data(self):
+        """Добавить тестовые учетные записи (python main.py --seed)"""
+        with self.connection() as conn:
+            self._seed_test_users(conn)
+
+    def _seed_test_users(self, conn):
+        cursor = conn.cursor()
 
         # Добавляем тестовых пользователей
         test_users = [
@@ -90,19 +364,48 @@ class Database:
             )
 
         conn.commit()
-        conn.close()
+
+    def restore_dropped_structures(self):
+        """Вернуть индексы и триггеры, снятые importer.py --rebuild-indexes, и пересчитать сводки.
+
+        Снятые объекты записываются в dropped_structures в одной транзакции с
+        удалением, поэтому после прерванной загрузки они возвращаются при
+        следующем открытии базы. Возвращает, было ли что возвращать.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            statements = [row[0] for row in conn.execute("SELECT sql FROM dropped_structures")]
+            if not statements:
+                conn.commit()
+                return False
+
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute("DELETE FROM dropped_structures")
+            # Триггеры сводок были сняты на время загрузки
+            rebuild_summaries(conn.cursor())
+            conn.commit()
+        return True
+
+    def rebuild_summaries(self):
+        """Пересчитать сводные таблицы оценок и посещаемости (python main.py --rebuild-summaries)"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rebuild_summaries(conn.cursor())
+            conn.commit()
+
+        self.clear_report_cache()
 
     def authenticate_user(self, username, password):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute(
-            "SELECT * FROM users WHERE username = ? AND password = ?",
-            (username, password)
-        )
+            cursor.execute(
+                "SELECT * FROM users WHERE username = ? AND password = ?",
+                (username, password)
+            )
 
-        user = cursor.fetchone()
-        conn.close()
+            user = cursor.fetchone()
 
         if user:
             return {
@@ -114,190 +417,650 @@ class Database:
             }
         return None
 
-    def get_student_grades(self, student_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def get_student_grades(self, student_id, include_archive=False, start=None, end=None):
+        """Оценки студента по предметам и датам: RecordColumns из GradeRecord.
 
-        cursor.execute('''
-            SELECT s.name, g.grade, g.date, g.teacher_name 
-            FROM grades g
-            JOIN subjects s ON g.subject_id = s.id
-            WHERE g.student_id = ?
-            ORDER BY s.name, g.date
-        ''', (student_id,))
+        include_archive - вместе с архивными семестрами (см. history);
+        start, end - только за период (даты включительно, см. _day_range).
+        """
+        days = self._day_range(start, end)
+        with self._reader(include_archive) as conn:
+            cursor = conn.cursor()
 
-        grades = cursor.fetchall()
-        conn.close()
-        return grades
+            cursor.execute(f'''
+                SELECT s.name, g.grade, g.date, g.teacher_name 
+                FROM {'all_grades' if include_archive else 'grades'} g
+                JOIN subjects s ON g.subject_id = s.id
+                WHERE g.student_id = ? {"AND g.date BETWEEN ? AND ?" if days else ""}
+                ORDER BY s.name, g.date, g.id
+            ''', (student_id, *(days or ())))
 
-    def get_student_attendance(self, student_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            return grade_columns(cursor)
+
+    def get_student_attendance(self, student_id, include_archive=False, start=None, end=None):
+        """Посещаемость студента от новых занятий к старым: RecordColumns из AttendanceRecord.
+
+        include_archive, start, end - как в get_student_grades.
+        """
+        days = self._day_range(start, end)
+        with self._reader(include_archive) as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(f'''
+                SELECT s.name, a.date, a.present 
+                FROM {'all_attendance' if include_archive else 'attendance'} a
+                JOIN subjects s ON a.subject_id = s.id
+                WHERE a.student_id = ? {"AND a.date BETWEEN ? AND ?" if days else ""}
+                ORDER BY a.date DESC
+            ''', (student_id, *(days or ())))
+
+            return attendance_columns(cursor)
+
+    def get_student_grades_page(self, student_id, limit=10, after=None):
+        """Страница оценок студента от новых к старым.
+
+        after - курсор (date, id), полученный с предыдущей страницы (дата - строка 'YYYY-MM-DD').
+        Возвращает (строки как в get_student_grades, курсор следующей страницы или None).
+        """
+        self._check_limit(limit)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            keyset = "AND (g.date, g.id) < (?, ?)" if after else ""
+            cursor.execute(f'''
+                SELECT s.name, g.grade, g.date, g.teacher_name, g.id
+                FROM grades g
+                JOIN subjects s ON g.subject_id = s.id
+                WHERE g.student_id = ? {keyset}
+                ORDER BY g.date DESC, g.id DESC
+                LIMIT ?
+            ''', (student_id, *self._day_cursor(after), limit + 1))
+
+            rows, next_cursor = self._page(cursor.fetchall(), limit, lambda row: (day_label(row[2]), row[4]))
+            return [
+                GradeRecord(subject, grade, day_label(day), teacher) for subject, grade, day, teacher, _ in rows
+            ], next_cursor
+
+    def get_student_attendance_page(self, student_id, limit=10, after=None):
+        """Страница посещаемости студента от новых занятий к старым.
+
+        after - курсор (date, id), полученный с предыдущей страницы (см. get_student_grades_page).
+        Возвращает (строки как в get_student_attendance, курсор следующей страницы или None).
+        """
+        self._check_limit(limit)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            keyset = "AND (a.date, a.id) < (?, ?)" if after else ""
+            cursor.execute(f'''
+                SELECT s.name, a.date, a.present, a.id
+                FROM attendance a
+                JOIN subjects s ON a.subject_id = s.id
+                WHERE a.student_id = ? {keyset}
+                ORDER BY a.date DESC, a.id DESC
+                LIMIT ?
+            ''', (student_id, *self._day_cursor(after), limit + 1))
+
+            rows, next_cursor = self._page(cursor.fetchall(), limit, lambda row: (day_label(row[1]), row[3]))
+            return [
+                AttendanceRecord(subject, day_label(day), present) for subject, day, present, _ in rows
+            ], next_cursor
+
+    def get_student_attendance_totals(self, student_id):
+        """(присутствовал, всего занятий) за всю историю по сводной таблице"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT s.name, a.date, a.present 
-            FROM attendance a
-            JOIN subjects s ON a.subject_id = s.id
-            WHERE a.student_id = ?
-            ORDER BY a.date DESC
-        ''', (student_id,))
+            cursor.execute('''
+                SELECT COALESCE(SUM(present_count), 0), COALESCE(SUM(total_count), 0)
+                FROM attendance_summary
+                WHERE student_id = ?
+            ''', (student_id,))
+
+            return cursor.fetchone()
+
+    def get_group_names(self):
+        """Названия всех групп в алфавитном порядке"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # Рекурсивный переход к следующему значению по индексу вместо обхода всей таблицы
+            cursor.execute('''
+                WITH RECURSIVE groups (name) AS (
+                    SELECT MIN(group_name) FROM users
+                    UNION ALL
+                    SELECT (SELECT MIN(group_name) FROM users WHERE group_name > groups.name)
+                    FROM groups
+                    WHERE groups.name IS NOT NULL
+                )
+                SELECT name FROM groups WHERE name IS NOT NULL
+            ''')
 
-        attendance = cursor.fetchall()
-        conn.close()
-        return attendance
+            return [row[0] for row in cursor.fetchall()]
 
     def get_group_students(self, group_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT id, full_name, username 
-            FROM users 
-            WHERE group_name = ? AND role = 'student'
-            ORDER BY full_name
-        ''', (group_name,))
+            cursor.execute('''
+                SELECT id, full_name, username 
+                FROM users 
+                WHERE group_name = ? AND role = 'student'
+                ORDER BY full_name
+            ''', (group_name,))
 
-        students = cursor.fetchall()
-        conn.close()
-        return students
+            return cursor.fetchall()
 
-    def get_group_grades(self, group_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def get_group_grades(self, group_name, start=None, end=None):
+        """Оценки группы: RecordColumns из GroupGradeRecord (start, end - как в get_student_grades)"""
+        days = self._day_range(start, end)
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT u.full_name, s.name, g.grade, g.date, g.teacher_name
-            FROM grades g
-            JOIN users u ON g.student_id = u.id
-            JOIN subjects s ON g.subject_id = s.id
-            WHERE u.group_name = ?
-            ORDER BY u.full_name, s.name
-        ''', (group_name,))
+            cursor.execute(f'''
+                SELECT u.full_name, s.name, g.grade, g.date, g.teacher_name
+                FROM grades g
+                JOIN users u ON g.student_id = u.id
+                JOIN subjects s ON g.subject_id = s.id
+                WHERE u.group_name = ? {"AND g.date BETWEEN ? AND ?" if days else ""}
+                ORDER BY u.full_name, s.name
+            ''', (group_name, *(days or ())))
 
-        grades = cursor.fetchall()
-        conn.close()
-        return grades
+            return group_grade_columns(cursor)
 
-    def add_grade(self, student_id, subject_name, grade, teacher_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def get_group_grades_page(self, group_name, limit=10, after=None):
+        """Оценки группы постранично: страница - limit студентов в порядке ФИО.
+
+        after - курсор (full_name, id) последнего студента предыдущей страницы.
+        Возвращает (строки как в get_group_grades, курсор следующей страницы или None).
+        """
+        self._check_limit(limit)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            keyset = "AND (full_name, id) > (?, ?)" if after else ""
+            cursor.execute(f'''
+                SELECT id, full_name
+                FROM users
+                WHERE group_name = ? AND role = 'student' {keyset}
+                ORDER BY full_name, id
+                LIMIT ?
+            ''', (group_name, *(after or ()), limit + 1))
+            students, next_cursor = self._page(cursor.fetchall(), limit, lambda row: (row[1], row[0]))
+
+            if not students:
+                return [], None
 
-        # Получаем ID предмета
-        cursor.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,))
-        subject = cursor.fetchone()
+            cursor.execute(f'''
+                SELECT u.full_name, s.name, g.grade, g.date, g.teacher_name
+                FROM grades g
+                JOIN users u ON g.student_id = u.id
+                JOIN subjects s ON g.subject_id = s.id
+                WHERE g.student_id IN ({', '.join('?' * len(students))})
+                ORDER BY u.full_name, u.id, s.name, g.date, g.id
+            ''', [student_id for student_id, _ in students])
+
+            return [
+                GroupGradeRecord(student, subject, grade, day_label(day), teacher)
+                for student, subject, grade, day, teacher in cursor
+            ], next_cursor
+
+    @staticmethod
+    def _day_range(start, end):
+        """(первый, последний) номер дня периода или None без ограничений.
+
+        start и end - date или строка 'YYYY-MM-DD', обе границы включаются;
+        незаданная граница не ограничивает период.
+        """
+        if start is None and end is None:
+            return None
+        return (day_number(start) if start is not None else day_number(date.min),
+                day_number(end) if end is not None else day_number(date.max))
+
+    @staticmethod
+    def _day_cursor(after):
+        """Параметры курсора (date, id) страницы истории: дата переводится в номер дня"""
+        return (day_number(after[0]), after[1]) if after else ()
+
+    @staticmethod
+    def _check_limit(limit):
+        # При limit < 1 курсор следующей страницы не сдвигается
+        if limit < 1:
+            raise ValueError(f"Размер страницы должен быть не меньше 1: {limit}")
+
+    @staticmethod
+    def _page(rows, limit, key):
+        """Отрезать лишнюю строку-признак следующей страницы и вычислить курсор"""
+        if len(rows) <= limit:
+            return rows, None
+        return rows[:limit], key(rows[limit - 1])
+
+    def get_student_subject_averages(self, student_id):
+        """Средний балл и число оценок студента по каждому предмету: [(предмет, средний, количество)]"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        if subject:
             cursor.execute('''
-                INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (student_id, subject[0], grade, datetime.now().strftime("%Y-%m-%d"), teacher_name))
+                SELECT s.name, CAST(gs.grade_sum AS REAL) / gs.grade_count, gs.grade_count
+                FROM grade_summary gs
+                JOIN subjects s ON gs.subject_id = s.id
+                WHERE gs.student_id = ?
+                ORDER BY s.name
+            ''', (student_id,))
 
-            conn.commit()
-            conn.close()
-            return True
+            return cursor.fetchall()
 
-        conn.close()
-        return False
+    def get_group_grade_statistics(self, group_name):
+        """Статистика оценок группы по сводной таблице grade_summary"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-    def add_attendance(self, student_id, subject_name, present):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            # Средние баллы студентов
+            cursor.execute('''
+                SELECT u.full_name, CAST(SUM(gs.grade_sum) AS REAL) / SUM(gs.grade_count)
+                FROM grade_summary gs
+                JOIN users u ON gs.student_id = u.id
+                WHERE u.group_name = ?
+                GROUP BY u.id
+                ORDER BY u.full_name
+            ''', (group_name,))
+            students = cursor.fetchall()
 
-        # Получаем ID предмета
-        cursor.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,))
-        subject = cursor.fetchone()
+            # Средние баллы по предметам
+            cursor.execute('''
+                SELECT s.name, CAST(SUM(gs.grade_sum) AS REAL) / SUM(gs.grade_count)
+                FROM grade_summary gs
+                JOIN users u ON gs.student_id = u.id
+                JOIN subjects s ON gs.subject_id = s.id
+                WHERE u.group_name = ?
+                GROUP BY s.id
+                ORDER BY s.name
+            ''', (group_name,))
+            subjects = cursor.fetchall()
 
-        if subject:
+            # Общие суммы и распределение оценок
             cursor.execute('''
+                SELECT SUM(gs.grade_sum), SUM(gs.grade_count),
+                       SUM(gs.count_5), SUM(gs.count_4), SUM(gs.count_3), SUM(gs.count_2)
+                FROM grade_summary gs
+                JOIN users u ON gs.student_id = u.id
+                WHERE u.group_name = ?
+            ''', (group_name,))
+            grade_sum, grade_count, *distribution = cursor.fetchone()
+
+        if not grade_count:
+            return None
+
+        return {
+            'students': students,
+            'subjects': subjects,
+            'average_grade': grade_sum / grade_count,
+            'total_grades': grade_count,
+            'distribution': dict(zip((5, 4, 3, 2), distribution))
+        }
+
+    def get_attendance_trend(self, period='week', student_id=None, subject=None, group_name=None,
+                             start=None, end=None, include_archive=False):
+        """Ряд посещаемости по неделям или месяцам: список AttendanceTrendRecord.
+
+        period - 'week' или 'month', в записи - дата начала периода, число
+        посещений, число занятий и процент посещаемости. Ряд ограничивается
+        студентом, предметом (по названию) и группой в любом сочетании;
+        start, end и include_archive - как в get_student_grades.
+        """
+        if period not in TREND_PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+
+        conditions = []
+        params = []
+        if subject is not None:
+            subject_id = self.get_subject_id(subject)
+            if subject_id is None:
+                return []
+            conditions.append("a.subject_id = ?")
+            params.append(subject_id)
+
+        with self._reader(include_archive) as conn:
+            if group_name is not None:
+                # Студенты группы подставляются списком: такое условие доходит до индекса
+                # (student_id, date) и в ветвях представления all_attendance
+                student_ids = [row[0] for row in conn.execute(
+                    "SELECT id FROM users WHERE group_name = ? AND role = 'student'", (group_name,)
+                )]
+                if student_id is not None:
+                    student_ids = [student_id] if student_id in student_ids else []
+                if not student_ids:
+                    return []
+                conditions.append(f"a.student_id IN ({', '.join('?' * len(student_ids))})")
+                params.extend(student_ids)
+            elif student_id is not None:
+                conditions.append("a.student_id = ?")
+                params.append(student_id)
+            elif subject is None:
+                # Ряд по всему факультету: список всех предметов ведет запрос по индексу
+                # (subject_id, date) и ограничивает его периодом в каждом предмете
+                subject_ids = list(self._subject_cache().values())
+                conditions.append(f"a.subject_id IN ({', '.join('?' * len(subject_ids))})")
+                params.extend(subject_ids)
+
+            days = self._day_range(start, end)
+            if days:
+                conditions.append("a.date BETWEEN ? AND ?")
+                params.extend(days)
+
+            cursor = conn.execute(f'''
+                SELECT {TREND_PERIODS[period]} AS period, SUM(CASE WHEN a.present THEN 1 ELSE 0 END), COUNT(*)
+                FROM {'all_attendance' if include_archive else 'attendance'} a
+                WHERE {' AND '.join(conditions) or 1}
+                GROUP BY period
+                ORDER BY period
+            ''', params)
+
+            return [
+                AttendanceTrendRecord(day_label(day), present, total, present / total * 100)
+                for day, present, total in cursor
+            ]
+
+    def add_grade(self, student_id, subject_name, grade, teacher_name):
+        if self.write_queue is not None:
+            return self.submit_grade(student_id, subject_name, grade, teacher_name).result()
+
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # ID предмета берется из кэша справочника
+            subject_id = self.get_subject_id(subject_name)
+
+            if subject_id is not None:
+                cursor.execute('''
+                    INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (student_id, subject_id, grade, day_number(date.today()), teacher_name))
+
+                conn.commit()
+                self._invalidate_students((student_id,))
+                return True
+
+            return False
+
+    def add_attendance(self, student_id, subject_name, present):
+        if self.write_queue is not None:
+            return self.submit_attendance(student_id, subject_name, present).result()
+
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # ID предмета берется из кэша справочника
+            subject_id = self.get_subject_id(subject_name)
+
+            if subject_id is not None:
+                cursor.execute('''
+                    INSERT INTO attendance (student_id, subject_id, date, present)
+                    VALUES (?, ?, ?, ?)
+                ''', (student_id, subject_id, day_number(date.today()), present))
+
+                conn.commit()
+                self._invalidate_students((student_id,))
+                return True
+
+            return False
+
+    def submit_grade(self, student_id, subject_name, grade, teacher_name):
+        """Поставить оценку в очередь записи.
+
+        Возвращает Future: результат True после фиксации, False для
+        неизвестного предмета. Без очереди запись выполняется сразу.
+        """
+        return self._submit(('grade', student_id, subject_name, grade, teacher_name,
+                             day_number(date.today())))
+
+    def submit_attendance(self, student_id, subject_name, present):
+        """Поставить отметку посещаемости в очередь записи (см. submit_grade)"""
+        return self._submit(('attendance', student_id, subject_name, present,
+                             day_number(date.today())))
+
+    def _submit(self, operation):
+        write_queue = self.write_queue
+        if write_queue is not None:
+            return write_queue.submit(operation)
+
+        future = Future()
+        try:
+            result, = self._write_operations([operation])
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        return future
+
+    def _write_operations(self, operations):
+        """Записать операции очереди одной транзакцией.
+
+        Если транзакция пачки не удалась, операции повторяются по одной,
+        чтобы ошибка досталась только своему Future.
+        """
+        try:
+            with self.connection() as conn:
+                lookup_subject = self._subject_lookup()
+                results = [self._write_operation(conn, lookup_subject, operation) for operation in operations]
+        except sqlite3.Error:
+            if len(operations) == 1:
+                raise
+            results = []
+            for operation in operations:
+                try:
+                    with self.connection() as conn:
+                        results.append(self._write_operation(conn, self._subject_lookup(), operation))
+                except sqlite3.Error as e:
+                    results.append(e)
+
+        self._invalidate_students(
+            operation[1] for operation, result in zip(operations, results) if result is True
+        )
+        return results
+
+    @staticmethod
+    def _write_operation(conn, lookup_subject, operation):
+        kind, student_id, subject_name, *values, day = operation
+        subject_id = lookup_subject(subject_name)
+        if subject_id is None:
+            return False
+
+        if kind == 'grade':
+            grade, teacher_name = values
+            conn.execute('''
+                INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (student_id, subject_id, grade, day, teacher_name))
+        else:
+            present, = values
+            conn.execute('''
                 INSERT INTO attendance (student_id, subject_id, date, present)
                 VALUES (?, ?, ?, ?)
-            ''', (student_id, subject[0], datetime.now().strftime("%Y-%m-%d"), present))
+            ''', (student_id, subject_id, day, present))
+        return True
+
+    def add_grades_batch(self, records):
+        """Добавить пачку оценок одной транзакцией.
+
+        records - итерируемое из (student_id, subject_name, grade, teacher_name).
+        Записи проверяются до вставки: неверная запись попадает в список
+        ошибок и не отменяет остальные.
+        Возвращает (число добавленных, список (индекс, запись, причина)).
+        """
+        today = day_number(date.today())
+
+        with self.connection() as conn:
+            lookup_subject = self._subject_lookup()
+            rows = []
+            failures = []
+
+            for index, record in enumerate(records):
+                try:
+                    student_id, subject_name, grade, teacher = record
+                except (TypeError, ValueError):
+                    failures.append((index, record, "Неверный формат записи"))
+                    continue
+
+                subject_id = lookup_subject(subject_name)
+                if subject_id is None:
+                    failures.append((index, record, f"Неизвестный предмет: {subject_name}"))
+                    continue
+
+                if not _is_int(student_id):
+                    failures.append((index, record, f"Неверный id студента: {student_id}"))
+                    continue
+                if not _is_int(grade) or grade < 2 or grade > 5:
+                    failures.append((index, record, "Оценка должна быть от 2 до 5"))
+                    continue
+                if not isinstance(teacher, str) or not teacher.strip():
+                    failures.append((index, record, "Не указан преподаватель"))
+                    continue
 
+                rows.append((student_id, subject_id, grade, today, teacher))
+
+            conn.executemany('''
+                INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
             conn.commit()
-            conn.close()
-            return True
 
-        conn.close()
-        return False
+        self._invalidate_students(row[0] for row in rows)
+        return len(rows), failures
 
-    def get_student_detailed_info(self, student_id):
-        """Получить детальную информацию о студенте для отчета"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def add_attendance_batch(self, records):
+        """Добавить пачку отметок посещаемости одной транзакцией.
 
-        # Основная информация о студенте
-        cursor.execute('''
-            SELECT full_name, group_name FROM users WHERE id = ?
-        ''', (student_id,))
-        student_info = cursor.fetchone()
+        records - итерируемое из (student_id, subject_name, present).
+        Записи проверяются до вставки, как в add_grades_batch.
+        Возвращает (число добавленных, список (индекс, запись, причина)).
+        """
+        today = day_number(date.today())
 
-        if not student_info:
-            return None
+        with self.connection() as conn:
+            lookup_subject = self._subject_lookup()
+            rows = []
+            failures = []
 
-        # Оценки
-        grades = self.get_student_grades(student_id)
+            for index, record in enumerate(records):
+                try:
+                    student_id, subject_name, present = record
+                except (TypeError, ValueError):
+                    failures.append((index, record, "Неверный формат записи"))
+                    continue
 
-        # Посещаемость
-        attendance = self.get_student_attendance(student_id)
+                subject_id = lookup_subject(subject_name)
+                if subject_id is None:
+                    failures.append((index, record, f"Неизвестный предмет: {subject_name}"))
+                    continue
 
-        # Расчет статистики
-        subject_stats = {}
-        for subject, grade, date, teacher in grades:
-            if subject not in subject_stats:
-                subject_stats[subject] = {'grades': [], 'teacher': teacher}
-            subject_stats[subject]['grades'].append(grade)
+                if not _is_int(student_id):
+                    failures.append((index, record, f"Неверный id студента: {student_id}"))
+                    continue
+                if present not in (True, False):
+                    failures.append((index, record, f"Неверная отметка присутствия: {present}"))
+                    continue
 
-        # Добавляем средние баллы
-        for subject, stats in subject_stats.items():
-            stats['average'] = sum(stats['grades']) / len(stats['grades'])
+                rows.append((student_id, subject_id, today, bool(present)))
 
-        # Статистика посещаемости
-        attendance_stats = {}
-        total_present = 0
-        total_classes = 0
+            conn.executemany('''
+                INSERT INTO attendance (student_id, subject_id, date, present)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
 
-        for subject, date, present in attendance:
-            if subject not in attendance_stats:
-                attendance_stats[subject] = {'present': 0, 'total': 0}
-            attendance_stats[subject]['total'] += 1
-            if present:
-                attendance_stats[subject]['present'] += 1
-                total_present += 1
-            total_classes += 1
+        self._invalidate_students(row[0] for row in rows)
+        return len(rows), failures
 
-        # Добавляем проценты посещаемости
-        for subject, stats in attendance_stats.items():
-            stats['attendance_rate'] = (stats['present'] / stats['total']) * 100 if stats['total'] > 0 else 0
+    def get_subjects(self):
+        """Названия предметов в порядке добавления (справочник для интерфейса)"""
+        return list(self._subject_cache())
 
-        overall_attendance = (total_present / total_classes) * 100 if total_classes > 0 else 0
+    def get_subject_id(self, subject_name):
+        subject_id = self._subject_cache().get(subject_name)
+        if subject_id is None:
+            # Предмет мог быть добавлен в базу после загрузки кэша
+            subject_id = self.refresh_subjects().get(subject_name)
+        return subject_id
 
-        conn.close()
+    def add_subject(self, subject_name):
+        with self.connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO subjects (name) VALUES (?)", (subject_name,))
+            conn.commit()
 
-        return {
-            'student_info': {
-                'full_name': student_info[0],
-                'group': student_info[1],
-                'student_id': student_id
-            },
-            'subjects': subject_stats,
-            'attendance': attendance_stats,
-            'overall_statistics': {
-                'average_grade': sum(grade for subject in subject_stats.values() for grade in subject['grades']) / sum(
-                    len(subject['grades']) for subject in subject_stats.values()) if subject_stats else 0,
-                'overall_attendance': overall_attendance,
-                'total_grades': sum(len(subject['grades']) for subject in subject_stats.values()),
-                'total_classes': total_classes
+        return self.refresh_subjects()[subject_name]
+
+    def refresh_subjects(self):
+        """Перечитать справочник предметов из базы"""
+        with self.connection() as conn:
+            subjects = {
+                name: subject_id
+                for subject_id, name in conn.execute("SELECT id, name FROM subjects ORDER BY id")
             }
-        }
 
-    def get_group_detailed_info(self, group_name):
-        """Получить детальную информацию о группе для отчета"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        self._subjects = subjects
+        return subjects
+
+    def _subject_cache(self):
+        subjects = self._subjects
+        if subjects is None:
+            subjects = self.refresh_subjects()
+        return subjects
+
+    def _subject_lookup(self):
+        """Поиск id предмета для пакетной вставки: при промахе кэш перечитывается не более одного раза"""
+        state = {'subjects': self._subject_cache(), 'refreshed': False}
 
-        # Получаем всех студентов группы
-        students = self.get_group_students(group_name)
+        def lookup(subject_name):
+            subject_id = state['subjects'].get(subject_name)
+            if subject_id is None and not state['refreshed']:
+                state['subjects'] = self.refresh_subjects()
+                state['refreshed'] = True
+                subject_id = state['subjects'].get(subject_name)
+            return subject_id
 
+        return lookup
+
+    def get_student_detailed_info(self, student_id, include_archive=False, start=None, end=None):
+        """Получить детальную информацию о студенте для отчета.
+
+        Результат может браться из кэша и разделяется между вызовами - не изменяйте его.
+        По умолчанию отчет строится по живому разделу; include_archive - по всем
+        семестрам, включая архивные, start и end - только за период (например,
+        семестр, см. archive.term_bounds). Такие отчеты не кэшируются.
+        """
+        days = self._day_range(start, end)
+        if include_archive or days:
+            with self._reader(include_archive) as conn:
+                reports = self._build_student_reports(conn, "u.id = ?", (student_id,), include_archive, days)
+            return reports[0] if reports else None
+
+        # Запись кэша сверяется с версией данных студента: записи других экземпляров
+        # Database и процессов (сервер, importer.py, archive.py) тоже меняют версию
+        use_cache = self.student_cache.maxsize > 0
+        if use_cache:
+            with self.connection() as conn:
+                report = self._cached_report(student_id, self._student_version(conn, student_id))
+            if report is not None:
+                return report
+
+        epoch = self._cache_epoch
+        with self.snapshot() as conn:
+            version = self._student_version(conn, student_id)
+            reports = self._build_student_reports(conn, "u.id = ?", (student_id,))
+
+        if not reports:
+            return None
+
+        if use_cache:
+            self._cache_reports(reports, epoch, {student_id: version})
+        return reports[0]
+
+    def get_group_detailed_info(self, group_name, include_archive=False, start=None, end=None):
+        """Получить детальную информацию о группе для отчета.
+
+        include_archive, start, end - как в get_student_detailed_info.
+        """
         group_data = {
             'group_name': group_name,
             'report_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -305,24 +1068,349 @@ class Database:
             'group_statistics': {}
         }
 
-        # Собираем данные по каждому студенту
-        student_stats = []
-        for student_id, full_name, username in students:
-            student_info = self.get_student_detailed_info(student_id)
-            if student_info:
-                group_data['students'].append(student_info)
-                student_stats.append(student_info['overall_statistics'])
+        days = self._day_range(start, end)
+        use_cache = not include_archive and days is None and self.student_cache.maxsize > 0
+        epoch = self._cache_epoch
+
+        with self.history() if include_archive else self.snapshot() as conn:
+            # Из кэша берутся только отчеты, построенные при той же версии данных студента,
+            # что и в снимке: все отчеты группы соответствуют одному состоянию базы
+            versions = self._group_student_versions(conn, group_name) if use_cache else {}
+            students = self.get_group_students(group_name)
+
+            reports = {}
+            missing = []
+            for student_id, full_name, username in students:
+                report = self._cached_report(student_id, versions.get(student_id, 0)) if use_cache else None
+                if report is None:
+                    missing.append(student_id)
+                else:
+                    reports[student_id] = report
+
+            # Отсутствующие в кэше студенты считаются одним набором запросов
+            if len(missing) == len(students):
+                built = self._build_student_reports(
+                    conn, GROUP_STUDENTS_CONDITION, (group_name,), include_archive, days
+                )
+            elif missing:
+                built = self._build_student_reports(
+                    conn, f"u.id IN ({', '.join('?' * len(missing))})", missing, include_archive, days
+                )
+            else:
+                built = []
+
+        for report in built:
+            reports[report['student_info']['student_id']] = report
+        if use_cache:
+            self._cache_reports(built, epoch, versions)
+
+        statistics = GroupStatistics()
+        for student_id, _, _ in students:
+            if student_id in reports:
+                group_data['students'].append(reports[student_id])
+                statistics.add(reports[student_id]['overall_statistics'])
 
         # Расчет общей статистики группы
-        if student_stats:
-            group_data['group_statistics'] = {
-                'total_students': len(student_stats),
-                'average_group_grade': sum(stat['average_grade'] for stat in student_stats) / len(student_stats),
-                'average_group_attendance': sum(stat['overall_attendance'] for stat in student_stats) / len(
-                    student_stats),
-                'total_grades': sum(stat['total_grades'] for stat in student_stats),
-                'total_classes': sum(stat['total_classes'] for stat in student_stats)
-            }
+        group_data['group_statistics'] = statistics.result()
+
+        return group_data
+
+    def get_groups_detailed_info(self, group_names=None):
+        """Отчеты нескольких групп (по умолчанию всех), прочитанные из одного снимка базы"""
+        with self.snapshot():
+            group_names = self.get_group_names() if group_names is None else list(group_names)
+            return [self.get_group_detailed_info(group_name) for group_name in group_names]
+
+    def iter_group_student_reports(self, group_name, include_archive=False, start=None, end=None):
+        """Отчеты студентов группы по одному, в порядке ФИО, без обращения к кэшу.
+
+        Все отчеты читаются из одного снимка базы (см. snapshot); соединение
+        остается занятым, пока генератор не исчерпан или не закрыт.
+        include_archive, start, end - как в get_student_detailed_info.
+        """
+        days = self._day_range(start, end)
+        if include_archive:
+            with self.history() as conn:
+                yield from self._iter_history_reports(conn, GROUP_STUDENTS_CONDITION, (group_name,), days)
+        else:
+            with self.snapshot() as conn:
+                yield from self._iter_student_reports(conn, GROUP_STUDENTS_CONDITION, (group_name,), days=days)
+
+    def get_group_delta(self, group_name, after=None):
+        """Изменения группы после номера журнала after (см. migrations.CHANGE_LOG_TRIGGERS).
+
+        Возвращает словарь: since - after, sequence - последний номер журнала
+        на момент чтения (его потребитель сохраняет через set_watermark),
+        grades и attendance - добавленные строки (GradeChangeRecord,
+        AttendanceChangeRecord) в порядке добавления, students - отчеты
+        затронутых студентов в порядке ФИО, как в get_group_detailed_info.
+        Без after выгружаются все живые строки и отчеты всех студентов группы.
+        Все читается из одного снимка; журнал читается по seq, поэтому
+        объем работы пропорционален числу изменений, а не размеру истории.
+        """
+        with self.snapshot() as conn:
+            sequence = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+            grades = [
+                GradeChangeRecord(row_id, student_id, subject, grade, day_label(day), teacher)
+                for row_id, student_id, subject, grade, day, teacher in self._changed_rows(
+                    conn, 'grades', "t.id, t.student_id, s.name, t.grade, t.date, t.teacher_name", group_name, after
+                )
+            ]
+            attendance = [
+                AttendanceChangeRecord(row_id, student_id, subject, day_label(day), present)
+                for row_id, student_id, subject, day, present in self._changed_rows(
+                    conn, 'attendance', "t.id, t.student_id, s.name, t.date, t.present", group_name, after
+                )
+            ]
+
+            if after is None:
+                students = self._build_student_reports(conn, GROUP_STUDENTS_CONDITION, (group_name,))
+            else:
+                student_ids = sorted({row.student_id for row in grades} | {row.student_id for row in attendance})
+                students = self._build_student_reports(
+                    conn, f"u.id IN ({', '.join('?' * len(student_ids))})", student_ids
+                ) if student_ids else []
+
+        return {
+            'group_name': group_name,
+            'since': after,
+            'sequence': sequence,
+            'grades': grades,
+            'attendance': attendance,
+            'students': students,
+        }
+
+    @staticmethod
+    def _changed_rows(conn, table, columns, group_name, after):
+        """Строки table студентов группы, добавленные после номера журнала after (без after - все)"""
+        if after is None:
+            return conn.execute(f'''
+                SELECT {columns}
+                FROM {table} t
+                JOIN users u ON t.student_id = u.id
+                JOIN subjects s ON t.subject_id = s.id
+                WHERE {GROUP_STUDENTS_CONDITION}
+                ORDER BY t.id
+            ''', (group_name,))
+
+        return conn.execute(f'''
+            SELECT {columns}
+            FROM change_log c
+            JOIN {table} t ON t.id = c.row_id
+            JOIN users u ON t.student_id = u.id
+            JOIN subjects s ON t.subject_id = s.id
+            WHERE c.seq > ? AND c.table_name = ? AND {GROUP_STUDENTS_CONDITION}
+            ORDER BY c.seq
+        ''', (after, table, group_name))
+
+    def get_database_id(self):
+        """Постоянный идентификатор базы (создается миграцией; у копии базы - тот же)"""
+        if self._database_id is None:
+            with self.connection() as conn:
+                self._database_id = conn.execute("SELECT id FROM database_info").fetchone()[0]
+        return self._database_id
 
-        conn.close()
-        return group_data
\ No newline at end of file
+    def get_group_version(self, group_name):
+        """Версия данных группы: меняется при любом изменении, влияющем на отчет группы (0 - изменений не было)"""
+        with self.connection() as conn:
+            return self._group_version(conn, group_name)
+
+    def get_watermark(self, consumer, group_name):
+        """Последний номер журнала изменений группы, выгруженный потребителю, или None"""
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT seq FROM watermarks WHERE consumer = ? AND group_name = ?", (consumer, group_name)
+            ).fetchone()
+            return row[0] if row else None
+
+    def set_watermark(self, consumer, group_name, sequence):
+        """Запомнить, что потребитель получил изменения группы до номера sequence включительно"""
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT INTO watermarks (consumer, group_name, seq, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (consumer, group_name) DO UPDATE SET
+                    seq = excluded.seq,
+                    updated_at = excluded.updated_at
+            ''', (consumer, group_name, sequence, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+
+    def clear_report_cache(self):
+        """Сбросить кэш отчетов (после массовых изменений в обход методов записи)"""
+        with self._cache_lock:
+            self._cache_epoch += 1
+            self.student_cache.clear()
+
+    def _invalidate_students(self, student_ids):
+        with self._cache_lock:
+            self._cache_epoch += 1
+            for student_id in set(student_ids):
+                self.student_cache.invalidate(student_id)
+
+    def _cache_reports(self, reports, epoch, versions):
+        """Положить отчеты в кэш, если с начала их построения не было записи.
+
+        versions - {student_id: версия данных студента} в снимке, из которого
+        построены отчеты; запись кэша хранит версию вместе с отчетом.
+        """
+        with self._cache_lock:
+            if self._cache_epoch != epoch:
+                return
+            for report in reports:
+                student_id = report['student_info']['student_id']
+                self.student_cache.put(student_id, (versions.get(student_id, 0), report))
+
+    def _cached_report(self, student_id, version):
+        """Отчет из кэша, если он построен при версии данных студента version, иначе None"""
+        entry = self.student_cache.get(student_id, valid=lambda entry: entry[0] == version)
+        return None if entry is None else entry[1]
+
+    @staticmethod
+    def _group_version(conn, group_name):
+        row = conn.execute("SELECT version FROM group_versions WHERE group_name = ?", (group_name,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _student_version(conn, student_id):
+        """Версия данных студента (migrations.STUDENT_VERSION_TRIGGERS), 0 - изменений не было"""
+        row = conn.execute("SELECT version FROM student_versions WHERE student_id = ?", (student_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _group_student_versions(conn, group_name):
+        """Версии данных студентов группы: {student_id: версия}"""
+        return dict(conn.execute(f'''
+            SELECT u.id, v.version
+            FROM users u
+            JOIN student_versions v ON v.student_id = u.id
+            WHERE {GROUP_STUDENTS_CONDITION}
+        ''', (group_name,)))
+
+    def _build_student_reports(self, conn, condition, params, include_archive=False, days=None):
+        if include_archive:
+            return list(self._iter_history_reports(conn, condition, params, days))
+        return list(self._iter_student_reports(conn, condition, params, days=days))
+
+    def _iter_history_reports(self, conn, condition, params, days=None):
+        """Отчеты с архивными семестрами; conn - соединение из history().
+
+        Условие на users не проталкивается в ветви UNION ALL представлений,
+        поэтому отчеты строятся по одному студенту: тогда каждый раздел
+        читается по индексу student_id, а не целиком.
+        """
+        student_ids = [row[0] for row in conn.execute(f'''
+            SELECT u.id
+            FROM users u
+            WHERE {condition}
+            ORDER BY u.full_name, u.id
+        ''', params)]
+
+        for student_id in student_ids:
+            yield from self._iter_student_reports(conn, "u.id = ?", (student_id,), include_archive=True, days=days)
+
+    def _iter_student_reports(self, conn, condition, params, include_archive=False, days=None):
+        """Отчеты по всем студентам, подходящим под условие на users u.
+
+        Вместо 1 + 3N запросов выполняются три: список студентов, оценки
+        и посещаемость по (студент, предмет) из сводной таблицы. Все три
+        курсора упорядочены по (ФИО, id) и читаются параллельно, поэтому
+        в памяти одновременно находится только текущий студент.
+        С include_archive оценки и посещаемость читаются из представлений
+        history(); days - (первый, последний) номер дня периода. В обоих
+        случаях посещаемость считается по отметкам, а не по сводной таблице.
+        """
+        grade_period = "AND g.date BETWEEN ? AND ?" if days else ""
+        attendance_period = "AND a.date BETWEEN ? AND ?" if days else ""
+        period_params = (*params, *days) if days else params
+
+        # Основная информация о студентах
+        students = conn.execute(f'''
+            SELECT u.id, u.full_name, u.group_name
+            FROM users u
+            WHERE {condition}
+            ORDER BY u.full_name, u.id
+        ''', params)
+
+        # Оценки: порядок внутри студента такой же, как в get_student_grades
+        grades = conn.execute(f'''
+            SELECT g.student_id, s.name, g.grade, g.teacher_name
+            FROM {'all_grades' if include_archive else 'grades'} g
+            JOIN users u ON g.student_id = u.id
+            JOIN subjects s ON g.subject_id = s.id
+            WHERE {condition} {grade_period}
+            ORDER BY u.full_name, u.id, s.name, g.date, g.id
+        ''', period_params)
+
+        # Посещаемость: предметы идут в порядке последнего занятия, как в get_student_attendance
+        if include_archive or days:
+            # Сводная таблица ведется только по живому разделу и за все время
+            attendance = conn.execute(f'''
+                SELECT a.student_id, s.name, SUM(CASE WHEN a.present THEN 1 ELSE 0 END), COUNT(*)
+                FROM {'all_attendance' if include_archive else 'attendance'} a
+                JOIN users u ON a.student_id = u.id
+                JOIN subjects s ON a.subject_id = s.id
+                WHERE {condition} {attendance_period}
+                GROUP BY a.student_id, a.subject_id
+                ORDER BY u.full_name, u.id, MAX(a.date) DESC, a.subject_id DESC
+            ''', period_params)
+        else:
+            attendance = conn.execute(f'''
+                SELECT a.student_id, s.name, a.present_count, a.total_count
+                FROM attendance_summary a
+                JOIN users u ON a.student_id = u.id
+                JOIN subjects s ON a.subject_id = s.id
+                WHERE {condition}
+                ORDER BY u.full_name, u.id, a.last_date DESC, a.subject_id DESC
+            ''', params)
+
+        grade_row = next(grades, None)
+        attendance_row = next(attendance, None)
+
+        for student_id, full_name, group in students:
+            subject_stats = {}
+            while grade_row is not None and grade_row[0] == student_id:
+                _, subject, grade, teacher = grade_row
+                stats = subject_stats.get(subject)
+                if stats is None:
+                    # Отчеты живут в кэше: названия предметов и преподавателей хранятся в одном экземпляре
+                    stats = subject_stats[intern_label(subject)] = {'grades': [], 'teacher': intern_label(teacher)}
+                stats['grades'].append(grade)
+                grade_row = next(grades, None)
+
+            attendance_stats = {}
+            while attendance_row is not None and attendance_row[0] == student_id:
+                _, subject, present, total = attendance_row
+                attendance_stats[intern_label(subject)] = {
+                    'present': present,
+                    'total': total,
+                    'attendance_rate': (present / total) * 100 if total > 0 else 0
+                }
+                attendance_row = next(attendance, None)
+
+            # Средние баллы и общая статистика
+            total_grades = 0
+            grades_sum = 0
+            for stats in subject_stats.values():
+                stats['average'] = sum(stats['grades']) / len(stats['grades'])
+                total_grades += len(stats['grades'])
+                grades_sum += sum(stats['grades'])
+
+            total_present = sum(stats['present'] for stats in attendance_stats.values())
+            total_classes = sum(stats['total'] for stats in attendance_stats.values())
+
+            yield {
+                'student_info': {
+                    'full_name': full_name,
+                    'group': group,
+                    'student_id': student_id
+                },
+                'subjects': subject_stats,
+                'attendance': attendance_stats,
+                'overall_statistics': {
+                    'average_grade': grades_sum / total_grades if subject_stats else 0,
+                    'overall_attendance': (total_present / total_classes) * 100 if total_classes > 0 else 0,
+                    'total_grades': total_grades,
+                    'total_classes': total_classes
+                }
+            }
@@ -0,0 +1,181 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from database import Database, open_database
+from reports import REPORT_FORMATS, open_report, safe_file_name, write_group_delta, write_group_report
+from sharding import ShardedDatabase
+
+# Соединения рабочего процесса: по одному на файл базы (у шардов файлы свои)
+_worker_dbs = {}
+
+
+def _worker_database(db_name):
+    db = _worker_dbs.get(db_name)
+    if db is None:
+        # У каждого процесса свое соединение только для чтения
+        db = _worker_dbs[db_name] = Database(db_name, pool_size=1, report_cache_size=0, read_only=True)
+    return db
+
+
+def _export_group(db_name, group_name, path, report_format, delta=False, after=None):
+    db = _worker_database(db_name)
+    started = time.perf_counter()
+    sequence = None
+    with open_report(path, report_format) as f:
+        if delta:
+            changes = write_group_delta(db, group_name, f, after, report_format)
+            students = len(changes['students'])
+            sequence = changes['sequence']
+        else:
+            students = write_group_report(db, group_name, f, report_format).get('total_students', 0)
+
+    return {
+        'group_name': group_name,
+        'path': path,
+        'students': students,
+        'sequence': sequence,
+        'bytes': os.path.getsize(path),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def report_path(output_dir, group_name, report_format, timestamp):
+    return os.path.join(output_dir, f"group_report_{safe_file_name(group_name)}_{timestamp}.{report_format}")
+
+
+def export_all(db_name, output_dir, report_format='json', workers=None, groups=None, consistent=False,
+               consumer=None):
+    """Сформировать отчеты по всем группам в пуле процессов.
+
+    Каждый отчет группы читается из своего снимка базы. При consistent=True
+    сначала делается копия базы (Database.backup), и все группы выгружаются
+    из нее - на один момент времени, а запись в основную базу на время
+    выгрузки ничем не задерживается.
+    db_name может быть и каталогом шардов (sharding.py): группа выгружается
+    из файла своего шарда, а при consistent=True копируется каждый шард
+    отдельно, то есть на один момент времени согласованы группы одного шарда.
+    consumer - выгружать только изменения с прошлой выгрузки этому
+    потребителю (reports.write_group_delta); водяные знаки групп
+    сохраняются в основной базе после успешной выгрузки группы.
+    Возвращает список результатов по группам в порядке завершения.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        with open_database(db_name, read_only=True) as db:
+            if groups is None:
+                groups = db.get_group_names()
+            watermarks = {
+                group_name: db.get_watermark(consumer, group_name) for group_name in groups
+            } if consumer is not None else {}
+            files = _group_files(db, groups, workdir if consistent else None)
+
+        results = _export_groups(files, groups, output_dir, report_format, workers, consumer, watermarks)
+
+    if consumer is not None:
+        with open_database(db_name, pool_size=1, report_cache_size=0) as db:
+            for result in results:
+                if 'error' not in result:
+                    db.set_watermark(consumer, result['group_name'], result['sequence'])
+
+    return results
+
+
+def _group_files(db, groups, snapshot_dir=None):
+    """Файл базы, из которого выгружается каждая группа: {группа: путь}.
+
+    Группы, которых нет в каталоге шардов, пропускаются. С snapshot_dir
+    каждый файл сначала копируется туда, и группы читаются из копий.
+    """
+    if isinstance(db, ShardedDatabase):
+        sources = {group_name: db.shard_for_group(group_name) for group_name in groups}
+    else:
+        sources = {group_name: db for group_name in groups}
+
+    files = {}
+    snapshots = {}
+    for group_name, source in sources.items():
+        if source is None:
+            continue
+        if snapshot_dir is None:
+            files[group_name] = source.db_name
+            continue
+        if source.db_name not in snapshots:
+            snapshots[source.db_name] = os.path.join(snapshot_dir, f"snapshot_{len(snapshots)}.db")
+            source.backup(snapshots[source.db_name])
+        files[group_name] = snapshots[source.db_name]
+    return files
+
+
+def _export_groups(files, groups, output_dir, report_format, workers, consumer, watermarks):
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    results = []
+    for group_name in groups:
+        if group_name not in files:
+            print(f"{group_name}: ошибка - неизвестная группа")
+            results.append({'group_name': group_name, 'error': "Неизвестная группа"})
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_export_group, files[group_name], group_name,
+                        report_path(output_dir, group_name, report_format, timestamp),
+                        report_format, consumer is not None, watermarks.get(group_name)): group_name
+            for group_name in groups if group_name in files
+        }
+
+        for done, future in enumerate(as_completed(futures), 1):
+            group_name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(futures)}] {group_name}: ошибка - {e}")
+                results.append({'group_name': group_name, 'error': str(e)})
+                continue
+
+            results.append(result)
+            print(f"[{done}/{len(futures)}] {group_name}: {result['students']} студентов, "
+                  f"{result['seconds']:.2f} с")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчеты по всем группам в параллельных процессах")
+    parser.add_argument('-o', '--output-dir', default="reports")
+    parser.add_argument('-f', '--format', choices=REPORT_FORMATS, default='json',
+                        help="формат отчетов; файлы групп получают это же расширение")
+    parser.add_argument('-j', '--workers', type=int, help="число процессов (по умолчанию - число CPU)")
+    parser.add_argument('--consistent', action='store_true',
+                        help="выгрузить все группы из копии базы на один момент времени")
+    parser.add_argument('--consumer',
+                        help="выгрузить только изменения с прошлой выгрузки этому потребителю")
+    parser.add_argument('--db', default="academic_system.db", help="файл базы или каталог шардов")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = export_all(args.db, args.output_dir, args.format, args.workers, consistent=args.consistent,
+                         consumer=args.consumer)
+    elapsed = time.perf_counter() - started
+
+    exported = [result for result in results if 'error' not in result]
+
+    print("\nИтоги по группам:")
+    for result in sorted(exported, key=lambda result: result['group_name']):
+        seconds = result['seconds'] or 1e-9
+        print(f"  {result['group_name']}: {result['students']} студентов за {result['seconds']:.2f} с "
+              f"({result['students'] / seconds:.0f} студ./с, {result['bytes'] / seconds / 1024 / 1024:.1f} МБ/с)")
+
+    students = sum(result['students'] for result in exported)
+    print(f"\nГрупп: {len(exported)} из {len(results)}, студентов: {students}, "
+          f"время: {elapsed:.2f} с ({students / elapsed if elapsed else 0:.0f} студ./с)")
+
+    return 0 if len(exported) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
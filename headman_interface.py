@@ -1,11 +1,15 @@
-from database import Database
-import json
+from database import get_database
+from reports import open_report, safe_file_name, write_group_report
+import analytics
 from datetime import datetime
 
 
 class HeadmanInterface:
-    def __init__(self, user_id, group_name):
-        self.db = Database()
+    # Студентов на одной странице успеваемости группы
+    PAGE_SIZE = 10
+
+    def __init__(self, user_id, group_name, db=None):
+        self.db = db or get_database()
         self.user_id = user_id
         self.group_name = group_name
 
@@ -38,18 +42,29 @@ class HeadmanInterface:
 
     def show_group_grades(self):
         print(f"\n=== УСПЕВАЕМОСТЬ ГРУППЫ {self.group_name} ===")
-        grades = self.db.get_group_grades(self.group_name)
+        cursor = None
+        shown = 0
+        while True:
+            # Страница - PAGE_SIZE студентов со всеми их оценками
+            grades, cursor = self.db.get_group_grades_page(self.group_name, self.PAGE_SIZE, cursor)
+
+            # Страница студентов без оценок пропускается без вопроса
+            if not grades:
+                if cursor is not None:
+                    continue
+                print("\nБольше оценок нет." if shown else "Оценок пока нет.")
+                return
 
-        if not grades:
-            print("Оценок пока нет.")
-            return
+            current_student = ""
+            for student, subject, grade, date, teacher in grades:
+                if student != current_student:
+                    current_student = student
+                    print(f"\n{student}:")
+                print(f"  {subject}: {grade} ({date})")
+            shown += len(grades)
 
-        current_student = ""
-        for student, subject, grade, date, teacher in grades:
-            if student != current_student:
-                current_student = student
-                print(f"\n{student}:")
-            print(f"  {subject}: {grade} ({date})")
+            if cursor is None or input("\nПоказать следующих студентов? (y/n): ").lower() != 'y':
+                break
 
     def add_grade(self):
         print("\n=== ДОБАВЛЕНИЕ ОЦЕНКИ ===")
@@ -71,10 +86,7 @@ class HeadmanInterface:
 
             student_id = students[student_choice][0]
 
-            subjects = [
-                'Математика', 'Физика', 'Программирование',
-                'Английский язык', 'История'
-            ]
+            subjects = self.db.get_subjects()
 
             print("\nДоступные предметы:")
             for i, subject in enumerate(subjects, 1):
@@ -110,10 +122,7 @@ class HeadmanInterface:
             print("В группе нет студентов.")
             return
 
-        subjects = [
-            'Математика', 'Физика', 'Программирование',
-            'Английский язык', 'История'
-        ]
+        subjects = self.db.get_subjects()
 
         print("\nДоступные предметы:")
         for i, subject in enumerate(subjects, 1):
@@ -128,11 +137,20 @@ class HeadmanInterface:
             subject_name = subjects[subject_choice]
 
             print(f"\nОтметка посещаемости для {subject_name}:")
+            records = []
             for student_id, full_name, username in students:
                 present = input(f"{full_name} присутствует? (y/n): ").lower() == 'y'
-                self.db.add_attendance(student_id, subject_name, present)
+                records.append((student_id, subject_name, present))
+
+            # Вся ведомость сохраняется одной транзакцией
+            inserted, failures = self.db.add_attendance_batch(records)
 
-            print("Посещаемость отмечена для всех студентов!")
+            if failures:
+                for index, record, reason in failures:
+                    print(f"Ошибка для {students[index][1]}: {reason}")
+                print(f"Посещаемость отмечена для {inserted} из {len(records)} студентов.")
+            else:
+                print("Посещаемость отмечена для всех студентов!")
 
         except ValueError:
             print("Ошибка ввода!")
@@ -140,74 +158,56 @@ class HeadmanInterface:
     def show_group_statistics(self):
         print(f"\n=== СТАТИСТИКА ГРУППЫ {self.group_name} ===")
 
-        grades = self.db.get_group_grades(self.group_name)
-        students = self.db.get_group_students(self.group_name)
+        statistics = analytics.collect_statistics(self.db, self.group_name)
 
-        if not grades:
+        if not statistics['total_grades']:
             print("Нет данных для статистики.")
             return
 
-        # Статистика по средним баллам
-        student_grades = {}
-        subject_grades = {}
-
-        for student, subject, grade, date, teacher in grades:
-            if student not in student_grades:
-                student_grades[student] = []
-            student_grades[student].append(grade)
-
-            if subject not in subject_grades:
-                subject_grades[subject] = []
-            subject_grades[subject].append(grade)
-
         print("\nСредние баллы студентов:")
-        for student, grades_list in student_grades.items():
-            average = sum(grades_list) / len(grades_list)
-            print(f"  {student}: {average:.2f}")
+        for student in statistics['students']:
+            if student['average_grade'] is not None:
+                print(f"  {student['full_name']}: {student['average_grade']:.2f}")
 
         print("\nСредние баллы по предметам:")
-        for subject, grades_list in subject_grades.items():
-            average = sum(grades_list) / len(grades_list)
-            print(f"  {subject}: {average:.2f}")
+        for subject in statistics['subjects']:
+            if subject['average_grade'] is not None:
+                print(f"  {subject['subject']}: {subject['average_grade']:.2f}")
 
         # Общая статистика
-        all_grades = [grade for _, _, grade, _, _ in grades]
-        overall_average = sum(all_grades) / len(all_grades)
-        excellent_count = len([g for g in all_grades if g == 5])
-        good_count = len([g for g in all_grades if g == 4])
-        satisfactory_count = len([g for g in all_grades if g == 3])
-        unsatisfactory_count = len([g for g in all_grades if g == 2])
+        distribution = statistics['distribution']
 
         print(f"\nОбщая статистика группы:")
-        print(f"  Средний балл: {overall_average:.2f}")
-        print(f"  Отличных оценок: {excellent_count}")
-        print(f"  Хороших оценок: {good_count}")
-        print(f"  Удовлетворительных: {satisfactory_count}")
-        print(f"  Неудовлетворительных: {unsatisfactory_count}")
+        print(f"  Средний балл: {statistics['average_grade']:.2f}")
+        print(f"  Стандартное отклонение: {statistics['std']:.2f}")
+        print(f"  Медиана: {statistics['percentiles'][50]:.1f}")
+        print(f"  Отличных оценок: {distribution[5]}")
+        print(f"  Хороших оценок: {distribution[4]}")
+        print(f"  Удовлетворительных: {distribution[3]}")
+        print(f"  Неудовлетворительных: {distribution[2]}")
 
     def generate_group_json_report(self):
         """Формирование отчета группы в JSON формате"""
         print("\n=== ФОРМИРОВАНИЕ ОТЧЕТА ГРУППЫ В JSON ===")
 
-        group_data = self.db.get_group_detailed_info(self.group_name)
-
-        if not group_data or not group_data['students']:
+        if not self.db.get_group_students(self.group_name):
             print("Нет данных для формирования отчета группы.")
             return
 
         # Создаем имя файла
-        filename = f"group_report_{self.group_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        filename = f"group_report_{safe_file_name(self.group_name)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
 
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(group_data, f, ensure_ascii=False, indent=2)
+            # Студенты записываются в файл по одному, статистика группы - в конце
+            with open_report(filename, 'json') as f:
+                statistics = write_group_report(self.db, self.group_name, f, 'json')
 
             print(f"Отчет группы успешно сохранен в файл: {filename}")
             print(f"Содержимое отчета:")
-            print(f"- Информация о группе: {group_data['group_name']}")
-            print(f"- Количество студентов: {len(group_data['students'])}")
-            print(f"- Средний балл группы: {group_data['group_statistics'].get('average_group_grade', 0):.2f}")
-            print(f"- Средняя посещаемость: {group_data['group_statistics'].get('average_group_attendance', 0):.1f}%")
+            print(f"- Информация о группе: {self.group_name}")
+            print(f"- Количество студентов: {statistics.get('total_students', 0)}")
+            print(f"- Средний балл группы: {statistics.get('average_group_grade', 0):.2f}")
+            print(f"- Средняя посещаемость: {statistics.get('average_group_attendance', 0):.1f}%")
             print(f"- Детальная информация по каждому студенту")
 
         except Exception as e:
@@ -0,0 +1,286 @@
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+
+from database import get_database
+from migrations import SUMMARY_TRIGGERS
+from models import day_number
+from sharding import ShardedDatabase
+
+# Поля входных записей; date необязателен (по умолчанию - сегодня)
+FIELDS = {
+    'grades': ('username', 'subject', 'grade', 'date', 'teacher_name'),
+    'attendance': ('username', 'subject', 'date', 'present'),
+}
+
+INSERT_SQL = {
+    'grades': '''
+        INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
+        VALUES (?, ?, ?, ?, ?)
+    ''',
+    'attendance': '''
+        INSERT INTO attendance (student_id, subject_id, date, present)
+        VALUES (?, ?, ?, ?)
+    ''',
+}
+
+PRESENT_VALUES = {
+    '1': True, 'true': True, 'y': True, 'yes': True, 'да': True, '+': True,
+    '0': False, 'false': False, 'n': False, 'no': False, 'нет': False, '-': False,
+}
+
+
+class RejectedRow(Exception):
+    """Строка отклонена: args - (причина[, исходная строка])"""
+
+
+def read_records(path, input_format):
+    """Построчно читать записи из CSV (с заголовком) или JSONL"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if input_format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield RejectedRow(f"Неверный JSON: {e}", line)
+
+
+class Importer:
+    """Пакетная загрузка оценок или посещаемости в базу.
+
+    Для ShardedDatabase каждая строка записывается в шард своего студента.
+    """
+
+    def __init__(self, db, kind, chunk_size=5000, reject_writer=None):
+        self.db = db
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.reject_writer = reject_writer
+        self.today = datetime.now().strftime("%Y-%m-%d")
+
+        # Справочники загружаются один раз на весь импорт; id пользователей
+        # сквозные, а id предметов - каталога (в шардах они свои). Оценки и
+        # посещаемость загружаются только студентам, не старостам
+        self.students = {}
+        for target in _databases(db):
+            with target.connection() as conn:
+                self.students.update(conn.execute("SELECT username, id FROM users WHERE role = 'student'"))
+        self.subjects = db.refresh_subjects()
+        self._shard_subjects = {}
+
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+
+    def run(self, records):
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self._load_chunk(chunk)
+
+        # Сводки студентов изменились в обход методов Database
+        self.db.clear_report_cache()
+
+    def _load_chunk(self, chunk):
+        rows = []
+        for record in chunk:
+            self.read += 1
+            if isinstance(record, RejectedRow):
+                self._reject(record.args[1], record.args[0])
+                continue
+
+            try:
+                rows.append(self._convert(record))
+            except RejectedRow as e:
+                self._reject(record, e.args[0])
+
+        # Одна транзакция на пачку (в каждом шарде - своя)
+        for db, db_rows in self._targets(rows):
+            with db.connection() as conn:
+                conn.executemany(INSERT_SQL[self.kind], db_rows)
+                conn.commit()
+
+        self.inserted += len(rows)
+
+    def _targets(self, rows):
+        """Разложить строки по базам: [(Database, строки)]"""
+        if not isinstance(self.db, ShardedDatabase):
+            return [(self.db, rows)]
+
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(self.db.shard_for_student(row[0]), []).append(row)
+
+        targets = []
+        for shard, shard_rows in by_shard.items():
+            subject_ids = self._subject_ids(shard)
+            targets.append((shard, [(row[0], subject_ids[row[1]], *row[2:]) for row in shard_rows]))
+        return targets
+
+    def _subject_ids(self, shard):
+        """Сопоставление id предметов каталога с id в шарде (по названию)"""
+        subject_ids = self._shard_subjects.get(shard)
+        if subject_ids is None:
+            shard_subjects = shard.refresh_subjects()
+            subject_ids = self._shard_subjects[shard] = {
+                subject_id: shard_subjects[name] for name, subject_id in self.subjects.items()
+            }
+        return subject_ids
+
+    def _convert(self, record):
+        if not isinstance(record, dict):
+            raise RejectedRow("Запись должна быть объектом")
+
+        student_id = self.students.get(str(record.get('username', '')).strip())
+        if student_id is None:
+            raise RejectedRow(f"Неизвестный студент: {record.get('username')}")
+
+        subject_id = self.subjects.get(str(record.get('subject', '')).strip())
+        if subject_id is None:
+            raise RejectedRow(f"Неизвестный предмет: {record.get('subject')}")
+
+        date = str(record.get('date') or self.today).strip()
+        try:
+            # В базе дата хранится номером дня
+            date = day_number(datetime.strptime(date, "%Y-%m-%d"))
+        except ValueError:
+            raise RejectedRow(f"Неверная дата: {date}")
+
+        if self.kind == 'grades':
+            try:
+                grade = int(record.get('grade'))
+            except (TypeError, ValueError):
+                raise RejectedRow(f"Неверная оценка: {record.get('grade')}")
+            if grade < 2 or grade > 5:
+                raise RejectedRow("Оценка должна быть от 2 до 5")
+
+            teacher_name = str(record.get('teacher_name') or '').strip()
+            if not teacher_name:
+                raise RejectedRow("Не указан преподаватель")
+
+            return student_id, subject_id, grade, date, teacher_name
+
+        present = record.get('present')
+        if not isinstance(present, bool):
+            present = PRESENT_VALUES.get(str(present).strip().lower())
+        if present is None:
+            raise RejectedRow(f"Неверная отметка присутствия: {record.get('present')}")
+
+        return student_id, subject_id, date, present
+
+    def _reject(self, record, reason):
+        self.rejected += 1
+        if self.reject_writer is not None:
+            self.reject_writer(record, reason)
+
+
+# Снимаются только триггеры сводок: rebuild_summaries пересчитывает сводки после
+# загрузки. Триггеры журнала изменений и версий групп остаются, иначе выгрузки
+# изменений и кэш отчетов не узнают о загруженных строках
+DROPPED_TRIGGERS = tuple(statement.split()[5] for statement in SUMMARY_TRIGGERS)
+
+
+def _databases(db):
+    """Файлы базы: шарды ShardedDatabase или сама Database"""
+    return [shard for _, shard in db.shards()] if isinstance(db, ShardedDatabase) else [db]
+
+
+def _without_secondary_structures(db, tables):
+    """Снять индексы и триггеры сводок с таблиц; возвращает базы, в которых они сняты.
+
+    Снятые объекты запоминаются в той же транзакции: если загрузка прервется,
+    база вернет их при следующем открытии (Database.restore_dropped_structures).
+    """
+    targets = []
+    for target in _databases(db):
+        with target.connection() as conn:
+            objects = conn.execute(f'''
+                SELECT type, name, sql FROM sqlite_master
+                WHERE (type = 'index' OR type = 'trigger' AND name IN ({', '.join('?' * len(DROPPED_TRIGGERS))}))
+                  AND sql IS NOT NULL AND tbl_name IN ({', '.join('?' * len(tables))})
+            ''', (*DROPPED_TRIGGERS, *tables)).fetchall()
+
+            for object_type, name, sql in objects:
+                conn.execute(f'DROP {object_type.upper()} "{name}"')
+                conn.execute("INSERT INTO dropped_structures (sql) VALUES (?)", (sql,))
+            conn.commit()
+
+        targets.append(target)
+    return targets
+
+
+def _restore_secondary_structures(targets):
+    for target in targets:
+        target.restore_dropped_structures()
+
+
+def _open_reject_writer(path, kind, input_format):
+    f = open(path, 'w', encoding='utf-8', newline='')
+
+    if input_format == 'csv':
+        writer = csv.DictWriter(f, fieldnames=FIELDS[kind] + ('error',), extrasaction='ignore')
+        writer.writeheader()
+
+        def write(record, reason):
+            row = dict(record) if isinstance(record, dict) else {}
+            row['error'] = reason
+            writer.writerow(row)
+    else:
+        def write(record, reason):
+            f.write(json.dumps({'record': record, 'error': reason}, ensure_ascii=False) + '\n')
+
+    return f, write
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовый импорт оценок или посещаемости из CSV/JSONL")
+    parser.add_argument('kind', choices=FIELDS, help="что загружать")
+    parser.add_argument('path', help="входной файл")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="формат файла (по умолчанию по расширению)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="строк в одной транзакции")
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help="снять индексы и триггеры сводок на время загрузки и построить заново")
+    parser.add_argument('--reject-file', help="куда записывать отклоненные строки")
+    parser.add_argument('--db', default="academic_system.db", help="файл базы или каталог шардов")
+    args = parser.parse_args(argv)
+
+    input_format = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    reject_path = args.reject_file or f"{args.path}.rejects.{input_format}"
+
+    db = get_database(args.db)
+    reject_file, reject_writer = _open_reject_writer(reject_path, args.kind, input_format)
+
+    started = time.perf_counter()
+    restore = _without_secondary_structures(db, (args.kind,)) if args.rebuild_indexes else None
+
+    try:
+        importer = Importer(db, args.kind, args.chunk_size, reject_writer)
+        importer.run(read_records(args.path, input_format))
+    finally:
+        reject_file.close()
+        if restore is not None:
+            _restore_secondary_structures(restore)
+
+    if not importer.rejected:
+        os.remove(reject_path)
+
+    elapsed = time.perf_counter() - started
+
+    print(f"Прочитано строк: {importer.read}")
+    print(f"Загружено: {importer.inserted}")
+    print(f"Отклонено: {importer.rejected}" + (f" (см. {reject_path})" if importer.rejected else ""))
+    print(f"Время: {elapsed:.2f} с, {importer.read / elapsed if elapsed else 0:.0f} строк/с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import atexit
+import functools
+import inspect
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from models import RecordColumns
+
+slow_query_log = logging.getLogger('academic.slow_queries')
+
+# Границы корзин гистограммы задержек в секундах: от 1 мкс до ~100 с с шагом 2^(1/4)
+_BUCKETS = [1e-6 * 2 ** (i / 4) for i in range(108)]
+
+
+def _normalize_sql(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def _redact(parameters):
+    """Значения параметров в журнал не попадают - только их типы"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+class LatencyStats:
+    """Счетчики вызовов и гистограмма задержек с постоянным расходом памяти"""
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+
+    def add(self, elapsed, rows=0):
+        self.count += 1
+        self.rows += rows
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect_left(_BUCKETS, elapsed)] += 1
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(_BUCKETS[index] if index < len(_BUCKETS) else self.max, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'rows': self.rows,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / self.count, 4) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50) * 1000, 4),
+            'p95_ms': round(self.percentile(0.95) * 1000, 4),
+            'p99_ms': round(self.percentile(0.99) * 1000, 4),
+            'max_ms': round(self.max * 1000, 4),
+        }
+
+
+class Instrumentation:
+    """Сбор статистики по методам Database и SQL-запросам.
+
+    Включается через Database(..., instrumentation=Instrumentation())
+    или db.enable_instrumentation(); без нее Database работает с обычными
+    соединениями sqlite3 и необернутыми методами.
+    """
+
+    def __init__(self, slow_query_ms=100.0, dump_path=None):
+        self.slow_query_ms = slow_query_ms
+        self.methods = {}
+        self.statements = {}
+        # RLock: запись может прийти из __del__ курсора во время сборки мусора
+        self._lock = threading.RLock()
+        self.dump_path = dump_path
+        self.connection_class = self._connection_class()
+        if dump_path:
+            atexit.register(self.dump)
+
+    def record_method(self, name, elapsed, rows=0):
+        with self._lock:
+            stats = self.methods.get(name)
+            if stats is None:
+                stats = self.methods[name] = LatencyStats()
+            stats.add(elapsed, rows)
+
+    def record_statement(self, sql, parameters, elapsed, rows):
+        key = _normalize_sql(sql)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = LatencyStats()
+            stats.add(elapsed, rows)
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            slow_query_log.warning("Медленный запрос %.1f мс (%d строк): %s params=%s",
+                                   elapsed * 1000, rows, key, _redact(parameters))
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+            self.statements.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'methods': {name: stats.snapshot() for name, stats in sorted(self.methods.items())},
+                'statements': {
+                    sql: stats.snapshot()
+                    for sql, stats in sorted(self.statements.items(), key=lambda item: -item[1].total)
+                },
+            }
+
+    def dump(self, path=None):
+        """Записать снимок статистики в JSON-файл (по умолчанию dump_path)"""
+        path = path or self.dump_path
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def _connection_class(self):
+        """Класс соединения sqlite3, замеряющий каждый запрос"""
+        instrumentation = self
+
+        class InstrumentedCursor(sqlite3.Cursor):
+            _pending = None
+
+            def execute(self, sql, parameters=()):
+                self._finish()
+                started = time.perf_counter()
+                super().execute(sql, parameters)
+                self._pending = [sql, parameters, time.perf_counter() - started, 0]
+                if self.description is None:
+                    self._finish()
+                return self
+
+            def executemany(self, sql, seq_of_parameters):
+                self._finish()
+                started = time.perf_counter()
+                super().executemany(sql, seq_of_parameters)
+                instrumentation.record_statement(sql, (), time.perf_counter() - started, max(self.rowcount, 0))
+                return self
+
+            def fetchone(self):
+                started = time.perf_counter()
+                row = super().fetchone()
+                self._account(started, 0 if row is None else 1, row is None)
+                return row
+
+            def fetchmany(self, size=None):
+                started = time.perf_counter()
+                rows = super().fetchmany(self.arraysize if size is None else size)
+                self._account(started, len(rows), not rows)
+                return rows
+
+            def fetchall(self):
+                started = time.perf_counter()
+                rows = super().fetchall()
+                self._account(started, len(rows), True)
+                return rows
+
+            def __next__(self):
+                started = time.perf_counter()
+                try:
+                    row = super().__next__()
+                except StopIteration:
+                    self._account(started, 0, True)
+                    raise
+                self._account(started, 1, False)
+                return row
+
+            def close(self):
+                self._finish()
+                super().close()
+
+            def __del__(self):
+                # Запрос, результат которого дочитан не до конца (fetchone)
+                self._finish()
+
+            def _account(self, started, rows, done):
+                pending = self._pending
+                if pending is not None:
+                    pending[2] += time.perf_counter() - started
+                    pending[3] += rows
+                    if done:
+                        self._finish()
+
+            def _finish(self):
+                pending = self._pending
+                if pending is not None:
+                    self._pending = None
+                    instrumentation.record_statement(*pending)
+
+        class InstrumentedConnection(sqlite3.Connection):
+            def cursor(self, factory=InstrumentedCursor):
+                return super().cursor(factory)
+
+            def execute(self, sql, parameters=()):
+                return self.cursor().execute(sql, parameters)
+
+            def executemany(self, sql, seq_of_parameters):
+                return self.cursor().executemany(sql, seq_of_parameters)
+
+        return InstrumentedConnection
+
+    def wrap_method(self, name, method):
+        """Обертка метода Database, замеряющая полное время вызова"""
+        instrumentation = self
+
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                produced = 0
+                try:
+                    for item in method(*args, **kwargs):
+                        produced += 1
+                        yield item
+                finally:
+                    instrumentation.record_method(name, time.perf_counter() - started, produced)
+
+            return generator_wrapper
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            finally:
+                rows = len(result) if isinstance(result, (list, RecordColumns)) else 0
+                instrumentation.record_method(name, time.perf_counter() - started, rows)
+
+        return wrapper
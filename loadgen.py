@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import quote
+
+from instrumentation import LatencyStats
+
+
+class Client:
+    """Минимальный HTTP/1.1 клиент с постоянным соединением"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.token = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        headers = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if self.token:
+            headers += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(headers.encode('latin-1') + b"\r\n" + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def login(self, username, password):
+        status, response = await self.request('POST', '/login', {'username': username, 'password': password})
+        if status != 200:
+            raise RuntimeError(f"Не удалось войти как {username}: {response.get('error')}")
+        self.token = response['token']
+        return response['user']
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def _headman_context(client, user):
+    """Студенты группы и предметы - для запросов старосты на запись"""
+    _, students = await client.request('GET', f"/groups/{quote(user['group_name'])}/students")
+    _, subjects = await client.request('GET', '/subjects')
+    return [student['id'] for student in students['students']], subjects['subjects']
+
+
+def _scenario(user, context, write_ratio, rng):
+    """Следующий запрос клиента: (метод, путь, тело)"""
+    if user['role'] == 'headman':
+        group = quote(user['group_name'])
+        student_ids, subjects = context
+        if student_ids and rng.random() < write_ratio:
+            return 'POST', '/attendance', {
+                'student_id': rng.choice(student_ids), 'subject': rng.choice(subjects), 'present': True
+            }
+        return rng.choice((
+            ('GET', f"/groups/{group}/grades?limit=20", None),
+            ('GET', f"/groups/{group}/statistics", None),
+            ('GET', f"/groups/{group}/report", None),
+        ))
+
+    student = user['id']
+    return rng.choice((
+        ('GET', f"/students/{student}/grades?limit=10", None),
+        ('GET', f"/students/{student}/attendance?limit=10", None),
+        ('GET', f"/students/{student}/report", None),
+    ))
+
+
+async def _worker(client, user, deadline, write_ratio, seed, latencies, errors):
+    rng = random.Random(seed)
+    context = await _headman_context(client, user) if user['role'] == 'headman' else None
+    while time.perf_counter() < deadline:
+        method, path, payload = _scenario(user, context, write_ratio, rng)
+        started = time.perf_counter()
+        status, _ = await client.request(method, path, payload)
+        latencies.add(time.perf_counter() - started)
+        if status != 200:
+            errors[status] = errors.get(status, 0) + 1
+
+
+async def run_load(host, port, accounts, clients, duration, write_ratio=0.0):
+    """Нагрузить сервис clients параллельными клиентами на duration секунд"""
+    sessions = []
+    for number in range(clients):
+        username, password = accounts[number % len(accounts)]
+        client = Client(host, port)
+        await client.connect()
+        sessions.append((client, await client.login(username, password)))
+
+    latencies = LatencyStats()
+    errors = {}
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            _worker(client, user, started + duration, write_ratio, number, latencies, errors)
+            for number, (client, user) in enumerate(sessions)
+        ))
+    finally:
+        for client, _ in sessions:
+            client.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'clients': clients,
+        'seconds': round(elapsed, 3),
+        'requests': latencies.count,
+        'requests_per_second': round(latencies.count / elapsed, 1),
+        'errors': errors,
+        'latency': latencies.snapshot(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP-сервиса (server.py)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('-c', '--clients', type=int, default=32, help="одновременных клиентов")
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help="длительность в секундах")
+    parser.add_argument('--write-ratio', type=float, default=0.0,
+                        help="доля запросов старост на запись (0.1 = 10%%)")
+    parser.add_argument('-u', '--user', action='append', metavar='LOGIN:PASSWORD',
+                        help="учетная запись клиента (можно несколько)")
+    args = parser.parse_args(argv)
+
+    accounts = [tuple(user.split(':', 1)) for user in args.user or ['student1:123456', 'headman1:123456']]
+    result = asyncio.run(run_load(args.host, args.port, accounts, args.clients, args.duration, args.write_ratio))
+
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    return 1 if result['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
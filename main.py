@@ -1,9 +1,29 @@
+import argparse
+
+import database
 from auth import AuthSystem
+from database import get_database
 from student_interface import StudentInterface
 from headman_interface import HeadmanInterface
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Система академического мониторинга")
+    parser.add_argument('--seed', action='store_true', help="добавить тестовые учетные записи")
+    parser.add_argument('--rebuild-summaries', action='store_true', help="пересчитать сводные таблицы")
+    parser.add_argument('--db', default=database.DEFAULT_DB_NAME, help="файл базы или каталог шардов")
+    args = parser.parse_args(argv)
+
+    database.DEFAULT_DB_NAME = args.db
+
+    if args.seed:
+        get_database().seed_test_data()
+        print("Тестовые учетные записи добавлены.")
+
+    if args.rebuild_summaries:
+        get_database().rebuild_summaries()
+        print("Сводные таблицы пересчитаны.")
+
     auth_system = AuthSystem()
 
     while True:
@@ -0,0 +1,608 @@
+"""Версионные миграции схемы.
+
+Номер версии схемы хранится в PRAGMA user_version. Миграция с номером N
+лежит в MIGRATIONS[N - 1]; новые миграции только добавляются в конец
+списка, уже выпущенные не меняются.
+"""
+
+
+def _create_base_tables(cursor):
+    # Таблица пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            role TEXT NOT NULL,
+            group_name TEXT NOT NULL
+        )
+    ''')
+
+    # Таблица предметов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+    # Таблица оценок
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            grade INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            teacher_name TEXT NOT NULL,
+            FOREIGN KEY (student_id) REFERENCES users (id),
+            FOREIGN KEY (subject_id) REFERENCES subjects (id)
+        )
+    ''')
+
+    # Таблица посещаемости
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            present BOOLEAN NOT NULL,
+            FOREIGN KEY (student_id) REFERENCES users (id),
+            FOREIGN KEY (subject_id) REFERENCES subjects (id)
+        )
+    ''')
+
+
+def _add_lookup_indexes(cursor):
+    # Оценки студента по предметам в порядке дат (get_student_grades, отчеты)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_grades_student_subject_date
+        ON grades (student_id, subject_id, date, grade)
+    ''')
+
+    # История посещаемости студента от новых занятий к старым
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_attendance_student_date
+        ON attendance (student_id, date, subject_id, present)
+    ''')
+
+    # Студенты группы, отсортированные по ФИО
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_group_role_name
+        ON users (group_name, role, full_name)
+    ''')
+
+    cursor.execute("ANALYZE")
+
+
+# Основные предметы, с которыми создается новая база
+DEFAULT_SUBJECTS = (
+    'Математика', 'Физика', 'Программирование',
+    'Английский язык', 'История'
+)
+
+
+def _seed_subjects(cursor):
+    # Добавляем основные предметы
+    for subject in DEFAULT_SUBJECTS:
+        cursor.execute(
+            "INSERT OR IGNORE INTO subjects (name) VALUES (?)",
+            (subject,)
+        )
+
+
+def _add_summary_tables(cursor):
+    # Сводка оценок по (студент, предмет): сумма, количество и гистограмма
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grade_summary (
+            student_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            grade_sum INTEGER NOT NULL DEFAULT 0,
+            grade_count INTEGER NOT NULL DEFAULT 0,
+            count_2 INTEGER NOT NULL DEFAULT 0,
+            count_3 INTEGER NOT NULL DEFAULT 0,
+            count_4 INTEGER NOT NULL DEFAULT 0,
+            count_5 INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, subject_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Сводка посещаемости по (студент, предмет)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_summary (
+            student_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            present_count INTEGER NOT NULL DEFAULT 0,
+            total_count INTEGER NOT NULL DEFAULT 0,
+            last_date TEXT,
+            PRIMARY KEY (student_id, subject_id)
+        ) WITHOUT ROWID
+    ''')
+
+    for statement in SUMMARY_TRIGGERS:
+        cursor.execute(statement)
+
+    rebuild_summaries(cursor)
+
+
+# Шаги триггеров, добавляющие/вычитающие строку NEW/OLD из сводок
+_GRADE_ADD = '''
+    INSERT INTO grade_summary (student_id, subject_id, grade_sum, grade_count,
+                               count_2, count_3, count_4, count_5)
+    VALUES (NEW.student_id, NEW.subject_id, NEW.grade, 1,
+            NEW.grade = 2, NEW.grade = 3, NEW.grade = 4, NEW.grade = 5)
+    ON CONFLICT (student_id, subject_id) DO UPDATE SET
+        grade_sum = grade_sum + excluded.grade_sum,
+        grade_count = grade_count + 1,
+        count_2 = count_2 + excluded.count_2,
+        count_3 = count_3 + excluded.count_3,
+        count_4 = count_4 + excluded.count_4,
+        count_5 = count_5 + excluded.count_5;
+'''
+
+_GRADE_REMOVE = '''
+    UPDATE grade_summary SET
+        grade_sum = grade_sum - OLD.grade,
+        grade_count = grade_count - 1,
+        count_2 = count_2 - (OLD.grade = 2),
+        count_3 = count_3 - (OLD.grade = 3),
+        count_4 = count_4 - (OLD.grade = 4),
+        count_5 = count_5 - (OLD.grade = 5)
+    WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id;
+    DELETE FROM grade_summary
+    WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id AND grade_count <= 0;
+'''
+
+_ATTENDANCE_ADD = '''
+    INSERT INTO attendance_summary (student_id, subject_id, present_count, total_count, last_date)
+    VALUES (NEW.student_id, NEW.subject_id, CASE WHEN NEW.present THEN 1 ELSE 0 END, 1, NEW.date)
+    ON CONFLICT (student_id, subject_id) DO UPDATE SET
+        present_count = present_count + excluded.present_count,
+        total_count = total_count + 1,
+        last_date = MAX(last_date, excluded.last_date);
+'''
+
+_ATTENDANCE_REMOVE = '''
+    UPDATE attendance_summary SET
+        present_count = present_count - (CASE WHEN OLD.present THEN 1 ELSE 0 END),
+        total_count = total_count - 1,
+        last_date = (
+            SELECT MAX(date) FROM attendance
+            WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id
+        )
+    WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id;
+    DELETE FROM attendance_summary
+    WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id AND total_count <= 0;
+'''
+
+SUMMARY_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS grades_summary_insert AFTER INSERT ON grades BEGIN {_GRADE_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS grades_summary_delete AFTER DELETE ON grades BEGIN {_GRADE_REMOVE} END",
+    f"CREATE TRIGGER IF NOT EXISTS grades_summary_update AFTER UPDATE ON grades BEGIN "
+    f"{_GRADE_REMOVE} {_GRADE_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_summary_insert AFTER INSERT ON attendance BEGIN {_ATTENDANCE_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_summary_delete AFTER DELETE ON attendance BEGIN {_ATTENDANCE_REMOVE} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_summary_update AFTER UPDATE ON attendance BEGIN "
+    f"{_ATTENDANCE_REMOVE} {_ATTENDANCE_ADD} END",
+]
+
+
+def rebuild_summaries(cursor):
+    """Пересчитать сводные таблицы с нуля по grades и attendance"""
+    cursor.execute("DELETE FROM grade_summary")
+    cursor.execute('''
+        INSERT INTO grade_summary (student_id, subject_id, grade_sum, grade_count,
+                                   count_2, count_3, count_4, count_5)
+        SELECT student_id, subject_id, SUM(grade), COUNT(*),
+               SUM(grade = 2), SUM(grade = 3), SUM(grade = 4), SUM(grade = 5)
+        FROM grades
+        GROUP BY student_id, subject_id
+    ''')
+
+    cursor.execute("DELETE FROM attendance_summary")
+    cursor.execute('''
+        INSERT INTO attendance_summary (student_id, subject_id, present_count, total_count, last_date)
+        SELECT student_id, subject_id, SUM(CASE WHEN present THEN 1 ELSE 0 END), COUNT(*), MAX(date)
+        FROM attendance
+        GROUP BY student_id, subject_id
+    ''')
+
+
+def _add_history_indexes(cursor):
+    # Постраничная история (date, id): id в индексе задает порядок для ключевой пагинации,
+    # остальные поля делают индекс покрывающим
+    cursor.execute("DROP INDEX IF EXISTS idx_attendance_student_date")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_attendance_student_date_id
+        ON attendance (student_id, date, id, subject_id, present)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_grades_student_date_id
+        ON grades (student_id, date, id, subject_id, grade)
+    ''')
+
+
+def _add_archive_registry(cursor):
+    # Реестр семестров, перенесенных в архивные файлы (archive.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archives (
+            term TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            grades INTEGER NOT NULL,
+            attendance INTEGER NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+
+
+# Перевод даты 'YYYY-MM-DD' в номер дня от 1970-01-01 (models.day_number) средствами SQLite
+def _day_from_text(column):
+    return (f"CASE WHEN typeof({column}) = 'text' "
+            f"THEN CAST(julianday({column}) - 2440587.5 AS INTEGER) ELSE {column} END")
+
+
+def _rebuild_table(cursor, table, definition, conversions, options=''):
+    """Пересоздать таблицу с новым определением столбцов.
+
+    Строки копируются (conversions - выражения для отдельных столбцов,
+    options - параметры таблицы вроде WITHOUT ROWID),
+    индексы таблицы создаются заново, счетчик AUTOINCREMENT сохраняется:
+    id строк, перенесенных в архивы, не должны выдаваться повторно.
+    """
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    indexes = [row[0] for row in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )]
+    sequence = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+
+    cursor.execute(f"CREATE TABLE {table}_new ({definition}) {options}")
+    cursor.execute(f'''
+        INSERT INTO {table}_new ({', '.join(columns)})
+        SELECT {', '.join(conversions.get(column, column) for column in columns)} FROM {table}
+    ''')
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    if sequence is not None:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+    for sql in indexes:
+        cursor.execute(sql)
+
+
+def _store_dates_as_days(cursor):
+    # Даты хранятся номером дня от 1970-01-01 (INTEGER): у столбца TEXT числа
+    # превращались бы обратно в строки, поэтому таблицы пересоздаются
+    triggers = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('grades', 'attendance')"
+    )]
+    for name in triggers:
+        cursor.execute(f"DROP TRIGGER {name}")
+
+    _rebuild_table(cursor, 'grades', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        grade INTEGER NOT NULL,
+        date INTEGER NOT NULL,
+        teacher_name TEXT NOT NULL,
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        FOREIGN KEY (subject_id) REFERENCES subjects (id)
+    ''', {'date': _day_from_text('date')})
+
+    _rebuild_table(cursor, 'attendance', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        date INTEGER NOT NULL,
+        present BOOLEAN NOT NULL,
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        FOREIGN KEY (subject_id) REFERENCES subjects (id)
+    ''', {'date': _day_from_text('date')})
+
+    _rebuild_table(cursor, 'attendance_summary', '''
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        total_count INTEGER NOT NULL DEFAULT 0,
+        last_date INTEGER,
+        PRIMARY KEY (student_id, subject_id)
+    ''', {'last_date': _day_from_text('last_date')}, 'WITHOUT ROWID')
+
+    for statement in SUMMARY_TRIGGERS:
+        cursor.execute(statement)
+
+
+def _add_date_range_indexes(cursor):
+    # Тренды посещаемости по предмету за период. Выборки за период по всему
+    # факультету и перенос семестров в архив идут по этому же индексу
+    # пропуском по subject_id (skip-scan): предметов немного
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_attendance_subject_date
+        ON attendance (subject_id, date, present)
+    ''')
+
+    cursor.execute("ANALYZE")
+
+
+# Журнал изменений: каждая вставка в grades и attendance получает следующий
+# номер seq. Потребители выгрузок (reports.py --consumer) запоминают
+# последний полученный номер и забирают только строки после него. Записи
+# в SQLite идут по одной, поэтому снимок базы видит журнал без пропусков.
+CHANGE_LOG_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS grades_change_log AFTER INSERT ON grades BEGIN "
+    "INSERT INTO change_log (table_name, row_id, student_id) VALUES ('grades', NEW.id, NEW.student_id); END",
+    "CREATE TRIGGER IF NOT EXISTS attendance_change_log AFTER INSERT ON attendance BEGIN "
+    "INSERT INTO change_log (table_name, row_id, student_id) VALUES ('attendance', NEW.id, NEW.student_id); END",
+]
+
+
+def _add_change_log(cursor):
+    # AUTOINCREMENT: номера seq только растут и не выдаются повторно
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL
+        )
+    ''')
+
+    # Последний номер журнала, выгруженный потребителю по группе
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS watermarks (
+            consumer TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (consumer, group_name)
+        ) WITHOUT ROWID
+    ''')
+
+    for statement in CHANGE_LOG_TRIGGERS:
+        cursor.execute(statement)
+
+
+# Запись случайного идентификатора базы, если его еще нет
+DATABASE_ID_SQL = '''
+    INSERT INTO {table} (id)
+    SELECT lower(hex(randomblob(16)))
+    WHERE NOT EXISTS (SELECT 1 FROM {table})
+'''
+
+
+# Версия данных группы растет при любой вставке, изменении и удалении оценок,
+# отметок посещаемости и студентов группы, в том числе при переносе в архив.
+# По ней reports.cached_group_report узнает, что готовый файл отчета устарел.
+def _bump_student_group(row):
+    return f'''
+        INSERT INTO group_versions (group_name, version)
+        SELECT group_name, 1 FROM users WHERE id = {row}.student_id
+        ON CONFLICT (group_name) DO UPDATE SET version = version + 1;
+    '''
+
+
+def _bump_group(row):
+    return f'''
+        INSERT INTO group_versions (group_name, version) VALUES ({row}.group_name, 1)
+        ON CONFLICT (group_name) DO UPDATE SET version = version + 1;
+    '''
+
+
+GROUP_VERSION_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS grades_version_insert AFTER INSERT ON grades BEGIN {_bump_student_group('NEW')} END",
+    f"CREATE TRIGGER IF NOT EXISTS grades_version_delete AFTER DELETE ON grades BEGIN {_bump_student_group('OLD')} END",
+    f"CREATE TRIGGER IF NOT EXISTS grades_version_update AFTER UPDATE ON grades BEGIN "
+    f"{_bump_student_group('OLD')} {_bump_student_group('NEW')} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_version_insert AFTER INSERT ON attendance BEGIN "
+    f"{_bump_student_group('NEW')} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_version_delete AFTER DELETE ON attendance BEGIN "
+    f"{_bump_student_group('OLD')} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_version_update AFTER UPDATE ON attendance BEGIN "
+    f"{_bump_student_group('OLD')} {_bump_student_group('NEW')} END",
+    f"CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users BEGIN {_bump_group('NEW')} END",
+    f"CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users BEGIN {_bump_group('OLD')} END",
+    # Пароль в отчеты не попадает: его смена версию не меняет
+    f"CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE OF full_name, role, group_name ON users BEGIN "
+    f"{_bump_group('OLD')} {_bump_group('NEW')} END",
+]
+
+
+def _add_group_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS group_versions (
+            group_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    for statement in GROUP_VERSION_TRIGGERS:
+        cursor.execute(statement)
+
+
+# Версия данных студента: растет при любом изменении его оценок, отметок и
+# учетной записи. Кэш сводок (Database.student_cache) хранит отчет вместе с ней,
+# поэтому запись по одному студенту не сбрасывает кэш остальных студентов группы.
+def _bump_student(student_id):
+    return f'''
+        INSERT INTO student_versions (student_id, version) VALUES ({student_id}, 1)
+        ON CONFLICT (student_id) DO UPDATE SET version = version + 1;
+    '''
+
+
+STUDENT_VERSION_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS grades_student_version_insert AFTER INSERT ON grades BEGIN "
+    f"{_bump_student('NEW.student_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS grades_student_version_delete AFTER DELETE ON grades BEGIN "
+    f"{_bump_student('OLD.student_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS grades_student_version_update AFTER UPDATE ON grades BEGIN "
+    f"{_bump_student('OLD.student_id')} {_bump_student('NEW.student_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_student_version_insert AFTER INSERT ON attendance BEGIN "
+    f"{_bump_student('NEW.student_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_student_version_delete AFTER DELETE ON attendance BEGIN "
+    f"{_bump_student('OLD.student_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS attendance_student_version_update AFTER UPDATE ON attendance BEGIN "
+    f"{_bump_student('OLD.student_id')} {_bump_student('NEW.student_id')} END",
+    # id удаленного пользователя может достаться новому: версия растет и при вставке
+    f"CREATE TRIGGER IF NOT EXISTS users_student_version_insert AFTER INSERT ON users BEGIN "
+    f"{_bump_student('NEW.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS users_student_version_delete AFTER DELETE ON users BEGIN "
+    f"{_bump_student('OLD.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS users_student_version_update AFTER UPDATE OF full_name, role, group_name "
+    f"ON users BEGIN {_bump_student('OLD.id')} {_bump_student('NEW.id')} END",
+]
+
+
+def _add_database_id(cursor):
+    # Постоянный случайный идентификатор базы: по нему различаются готовые файлы
+    # отчетов разных баз (reports.cached_group_report), в том числе базы,
+    # пересозданной на том же месте с версиями групп, начатыми заново
+    cursor.execute("CREATE TABLE IF NOT EXISTS database_info (id TEXT NOT NULL)")
+    cursor.execute(DATABASE_ID_SQL.format(table='database_info'))
+
+
+def _add_student_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS student_versions (
+            student_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+
+    for statement in STUDENT_VERSION_TRIGGERS:
+        cursor.execute(statement)
+
+
+def _add_dropped_structures(cursor):
+    # Индексы и триггеры, снятые на время загрузки (importer.py --rebuild-indexes):
+    # записываются вместе с удалением и возвращаются Database.restore_dropped_structures
+    cursor.execute("CREATE TABLE IF NOT EXISTS dropped_structures (sql TEXT NOT NULL)")
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_lookup_indexes,
+    _seed_subjects,
+    _add_summary_tables,
+    _add_history_indexes,
+    _add_archive_registry,
+    _store_dates_as_days,
+    _add_date_range_indexes,
+    _add_change_log,
+    _add_group_versions,
+    _add_database_id,
+    _add_student_versions,
+    _add_dropped_structures,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Применить к базе все недостающие миграции по порядку.
+
+    Каждая миграция выполняется в своей транзакции вместе с обновлением
+    user_version, поэтому прерванное обновление можно просто запустить снова.
+    """
+    while True:
+        # IMMEDIATE сразу берет блокировку записи: два процесса не применят
+        # одну и ту же миграцию дважды
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.commit()
+                return version
+
+            MIGRATIONS[version](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+# Архивные файлы семестров (archive.py): таблицы с теми же столбцами, что в живой
+# базе, без сводок и триггеров. Версия схемы хранится в user_version файла.
+ARCHIVE_SCHEMA_VERSION = 1
+
+# Таблицы, закрытые семестры которых переносятся в архивы, и их столбцы
+ARCHIVED_TABLES = {
+    'grades': 'id, student_id, subject_id, grade, date, teacher_name',
+    'attendance': 'id, student_id, subject_id, date, present',
+}
+
+
+def _create_archive_tables(conn, schema):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.grades (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            grade INTEGER NOT NULL,
+            date INTEGER NOT NULL,
+            teacher_name TEXT NOT NULL
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.attendance (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            date INTEGER NOT NULL,
+            present BOOLEAN NOT NULL
+        )
+    ''')
+
+
+def _create_archive_indexes(conn, schema):
+    # История студента, в том числе за период, как в живой базе
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS {schema}.idx_grades_student_date_id
+        ON grades (student_id, date, id, subject_id, grade)
+    ''')
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS {schema}.idx_attendance_student_date_id
+        ON attendance (student_id, date, id, subject_id, present)
+    ''')
+
+
+def upgrade_archive(conn, schema):
+    """Создать или обновить схему архивного файла, подключенного как schema.
+
+    Вызывается вне транзакции. Архивы, созданные до перехода на номера
+    дней, пересоздаются с целочисленными датами.
+    """
+    if conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0] >= ARCHIVE_SCHEMA_VERSION:
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+        for table in ARCHIVED_TABLES:
+            if table in existing:
+                conn.execute(f"ALTER TABLE {schema}.{table} RENAME TO {table}_text")
+
+        _create_archive_tables(conn, schema)
+        for table, columns in ARCHIVED_TABLES.items():
+            if table in existing:
+                values = ', '.join(
+                    _day_from_text(column) if column == 'date' else column for column in columns.split(', ')
+                )
+                conn.execute(f"INSERT INTO {schema}.{table} ({columns}) SELECT {values} FROM {schema}.{table}_text")
+                conn.execute(f"DROP TABLE {schema}.{table}_text")
+
+        _create_archive_indexes(conn, schema)
+        conn.execute(f"PRAGMA {schema}.user_version = {ARCHIVE_SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
@@ -1,13 +1,174 @@
-from datetime import datetime
+import sys
+from array import array
+from collections import namedtuple
+from datetime import date, datetime, timedelta
 from enum import Enum
+from functools import lru_cache
 
 class UserRole(Enum):
     STUDENT = "student"
     HEADMAN = "headman"
 
-class Subject(Enum):
-    MATH = "Математика"
-    PHYSICS = "Физика"
-    PROGRAMMING = "Программирование"
-    ENGLISH = "Английский язык"
-    HISTORY = "История"
\ No newline at end of file
+
+class GroupStatistics:
+    """Накопитель общей статистики группы по overall_statistics студентов"""
+
+    def __init__(self):
+        self.total_students = 0
+        self.grade_sum = 0
+        self.attendance_sum = 0
+        self.total_grades = 0
+        self.total_classes = 0
+
+    def add(self, stats):
+        self.total_students += 1
+        self.grade_sum += stats['average_grade']
+        self.attendance_sum += stats['overall_attendance']
+        self.total_grades += stats['total_grades']
+        self.total_classes += stats['total_classes']
+
+    def result(self):
+        if not self.total_students:
+            return {}
+
+        return {
+            'total_students': self.total_students,
+            'average_group_grade': self.grade_sum / self.total_students,
+            'average_group_attendance': self.attendance_sum / self.total_students,
+            'total_grades': self.total_grades,
+            'total_classes': self.total_classes
+        }
+
+
+# Строки результатов запросов. Это обычные кортежи с именованными полями:
+# распаковка и индексация работают как раньше, а __slots__ = () у namedtuple
+# не добавляет к кортежу словарь атрибутов.
+GradeRecord = namedtuple('GradeRecord', 'subject grade date teacher')
+AttendanceRecord = namedtuple('AttendanceRecord', 'subject date present')
+GroupGradeRecord = namedtuple('GroupGradeRecord', 'student subject grade date teacher')
+AttendanceTrendRecord = namedtuple('AttendanceTrendRecord', 'period present total rate')
+# Строки выгрузки изменений (Database.get_group_delta): с id строки и студента
+GradeChangeRecord = namedtuple('GradeChangeRecord', 'id student_id subject grade date teacher')
+AttendanceChangeRecord = namedtuple('AttendanceChangeRecord', 'id student_id subject date present')
+
+# Даты в базе хранятся номером дня от 1970-01-01: целое число занимает в строке
+# и в индексе 2-3 байта вместо 10 байт строки 'YYYY-MM-DD'
+DAY_EPOCH = date(1970, 1, 1)
+
+
+def day_number(value):
+    """Номер дня для date, datetime или строки 'YYYY-MM-DD' (целое возвращается как есть)"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - DAY_EPOCH).days
+
+
+@lru_cache(maxsize=None)
+def day_label(day):
+    """Строка 'YYYY-MM-DD' по номеру дня, одна на день на процесс"""
+    return sys.intern((DAY_EPOCH + timedelta(days=day)).isoformat())
+
+
+def intern_label(value):
+    """Одна копия повторяющейся строки (предмет, преподаватель, дата) на процесс"""
+    return sys.intern(value) if type(value) is str else value
+
+
+# Код типа поля RecordColumns для дат: хранится номер дня, наружу отдается строка 'YYYY-MM-DD'
+DAY = 'day'
+
+
+class RecordColumns:
+    """Результат запроса, хранящийся по столбцам.
+
+    Числовые поля лежат в array с заданным кодом типа, даты (DAY) - номерами
+    дней в array('i'), текстовые - номерами в array('I') со словарем значений,
+    поэтому повторяющиеся названия предметов и ФИО хранятся по одному разу.
+    Снаружи контейнер ведет себя как список записей record_type.
+    """
+
+    __slots__ = ('record_type', 'typecodes', 'columns', 'labels', '_codes')
+
+    def __init__(self, record_type, typecodes, rows=()):
+        # typecodes: код типа array для каждого поля, DAY для даты или None для текстового поля
+        self.record_type = record_type
+        self.typecodes = typecodes
+        self.columns = tuple(
+            array('I' if typecode is None else 'i' if typecode == DAY else typecode) for typecode in typecodes
+        )
+        self.labels = []
+        self._codes = {}
+        self.extend(rows)
+
+    def extend(self, rows):
+        codes = self._codes
+        labels = self.labels
+        appenders = [column.append for column in self.columns]
+        textual = [typecode is None for typecode in self.typecodes]
+
+        for row in rows:
+            for append, is_text, value in zip(appenders, textual, row):
+                if is_text:
+                    code = codes.get(value)
+                    if code is None:
+                        code = codes[value] = len(labels)
+                        labels.append(intern_label(value))
+                    value = code
+                append(value)
+
+    def _decoders(self):
+        """Функция перевода хранимого значения в значение записи для каждого поля (None - как есть)"""
+        return [
+            self.labels.__getitem__ if typecode is None else day_label if typecode == DAY else None
+            for typecode in self.typecodes
+        ]
+
+    def column(self, name):
+        """Значения одного поля: array для числовых, список для текстовых и дат"""
+        index = self.record_type._fields.index(name)
+        decode = self._decoders()[index]
+        if decode is not None:
+            return [decode(value) for value in self.columns[index]]
+        return self.columns[index]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        return self.record_type._make(
+            column[index] if decode is None else decode(column[index])
+            for decode, column in zip(self._decoders(), self.columns)
+        )
+
+    def __iter__(self):
+        decoded = [
+            column if decode is None else map(decode, column)
+            for decode, column in zip(self._decoders(), self.columns)
+        ]
+        return map(self.record_type._make, zip(*decoded))
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, RecordColumns)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.record_type.__name__}, {len(self)} строк)"
+
+
+def grade_columns(rows=()):
+    return RecordColumns(GradeRecord, (None, 'b', DAY, None), rows)
+
+
+def attendance_columns(rows=()):
+    return RecordColumns(AttendanceRecord, (None, DAY, 'b'), rows)
+
+
+def group_grade_columns(rows=()):
+    return RecordColumns(GroupGradeRecord, (None, None, 'b', DAY, None), rows)
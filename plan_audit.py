@@ -0,0 +1,169 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+from benchmark import build_cases, generate
+from database import Database
+
+# Таблицы, полный просмотр которых считается ошибкой
+WATCHED_TABLES = ('grades', 'attendance', 'users')
+
+# Запросы, которым полный просмотр нужен по смыслу: (шаблон, причина)
+ALLOWED_SCANS = [
+    (r'^INSERT INTO grade_summary .* FROM grades GROUP BY', "rebuild_summaries пересчитывает всю таблицу"),
+    (r'^INSERT INTO attendance_summary .* FROM attendance GROUP BY', "rebuild_summaries пересчитывает всю таблицу"),
+    (r"FROM (users u|grade_summary gs|attendance_summary a) .*WHERE u\.role = 'student'( ORDER BY|$)",
+     "analytics по всему факультету читает всех студентов"),
+]
+
+_SKIPPED_PREFIXES = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'ANALYZE', '--',
+                     'ATTACH', 'DETACH', 'CREATE TEMP VIEW', 'DROP VIEW')
+
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class TracingDatabase(Database):
+    """Database, запоминающая текст каждого выполненного запроса"""
+
+    def __init__(self, *args, **kwargs):
+        self.traced = []
+        self.tracing = False
+        super().__init__(*args, **kwargs)
+
+    def get_connection(self):
+        conn = super().get_connection()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, sql):
+        if self.tracing:
+            self.traced.append(sql)
+
+
+def collect_statements(db):
+    """Выполнить все замеряемые в benchmark сценарии и вернуть уникальные запросы"""
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = build_cases(db, workdir)
+        db.tracing = True
+        try:
+            for function in cases.values():
+                function()
+        finally:
+            db.tracing = False
+
+    statements = {}
+    for sql in db.traced:
+        sql = _normalize(sql)
+        if sql.upper().startswith(_SKIPPED_PREFIXES):
+            continue
+        # Запросы с разными литералами считаются одним
+        key = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', sql)
+        statements.setdefault(key, sql)
+
+    return list(statements.values())
+
+
+def _aliases(sql):
+    """Псевдонимы таблиц запроса: {псевдоним: таблица}"""
+    return {
+        alias: table
+        for table, alias in re.findall(r'\b(?:FROM|JOIN) (\w+)(?: AS)? (\w+)', sql, re.IGNORECASE)
+    }
+
+
+def explain(db, sql):
+    # Представления all_grades и all_attendance существуют только внутри db.history()
+    with db.history() if re.search(r'\ball_(grades|attendance)\b', sql) else db.connection() as conn:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def audit(db):
+    """Проверить планы всех запросов.
+
+    Возвращает список (запрос, план, нарушения, предупреждения, причина_разрешения).
+    Нарушение - полный просмотр одной из WATCHED_TABLES (в том числе в
+    архивах и ветвях представлений history), предупреждение -
+    сортировка во временном B-дереве.
+    """
+    findings = []
+    for sql in collect_statements(db):
+        plan = explain(db, sql)
+        aliases = _aliases(sql)
+
+        violations = []
+        warnings = []
+        for step in plan:
+            # Таблицы архивов и живого раздела в плане идут с именем схемы: SCAN main.grades
+            match = re.match(r'SCAN (?:\w+\.)?(\w+)', step)
+            if match and aliases.get(match.group(1), match.group(1)) in WATCHED_TABLES:
+                violations.append(step)
+            elif 'USE TEMP B-TREE' in step:
+                warnings.append(step)
+
+        allowed = next((reason for pattern, reason in ALLOWED_SCANS if re.search(pattern, sql)), None)
+        findings.append((sql, plan, violations, warnings, allowed))
+
+    return findings
+
+
+def assert_no_full_scans(db):
+    """Для использования в тестах: AssertionError при недопустимом полном просмотре"""
+    failures = [
+        f"{sql}\n    " + "\n    ".join(violations)
+        for sql, plan, violations, warnings, allowed in audit(db)
+        if violations and not allowed
+    ]
+    assert not failures, "Полный просмотр таблиц:\n" + "\n".join(failures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка планов запросов Database на полный просмотр таблиц")
+    parser.add_argument('--db', help="заполненная база (по умолчанию генерируется синтетическая)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="печатать планы всех запросов")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "audit.db")
+        if args.db:
+            # Сценарии пишут в базу, поэтому проверка идет на копии
+            source = sqlite3.connect(args.db)
+            target = sqlite3.connect(db_path)
+            source.backup(target)
+            source.close()
+            target.close()
+        else:
+            generate(db_path, groups=2, students=20, subjects=5, years=1).close()
+
+        db = TracingDatabase(db_path)
+
+        findings = audit(db)
+        db.close()
+
+    failed = 0
+    for sql, plan, violations, warnings, allowed in findings:
+        if violations and not allowed:
+            status = "ПОЛНЫЙ ПРОСМОТР"
+            failed += 1
+        elif violations:
+            status = f"разрешено: {allowed}"
+        elif warnings:
+            status = "временная сортировка"
+        else:
+            status = None
+
+        if status or args.verbose:
+            print(f"[{status or 'OK'}] {sql}")
+            for step in plan:
+                print(f"    {step}")
+
+    print(f"Проверено запросов: {len(findings)}, с недопустимым полным просмотром: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """Потокобезопасный пул долгоживущих соединений SQLite"""
+
+    def __init__(self, factory, size=5, timeout=30.0):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # Вложенный вызов в том же потоке работает в уже выданном соединении
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._opened) < self.size:
+                conn = self.factory()
+                self._opened.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Нет свободных соединений в пуле")
+
+    def _release(self, conn):
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._opened:
+                self._opened.remove(conn)
+        try:
+            conn.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+        conn.close()
+
+    def close(self):
+        """Закрыть все простаивающие соединения; занятые закроются при возврате"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
@@ -0,0 +1,310 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+from contextlib import nullcontext, suppress
+from datetime import datetime
+
+from database import get_database
+from models import GroupStatistics
+
+# Форматы *.gz - то же содержимое, сжатое gzip: отчет в 5-10 раз меньше
+REPORT_FORMATS = ('json', 'jsonl', 'json.gz', 'jsonl.gz')
+
+# Уровень сжатия gzip: 6 сжимает почти как 9, но заметно быстрее
+REPORT_COMPRESSLEVEL = 6
+
+# Каталог готовых файлов отчетов (cached_group_report)
+REPORT_CACHE_DIR = "report_cache"
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _layout(report_format):
+    """Содержимое формата без сжатия: json или jsonl"""
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {report_format}")
+    return report_format.removesuffix('.gz')
+
+
+def report_format_of(path):
+    """Формат отчета по расширению файла"""
+    for report_format in sorted(REPORT_FORMATS, key=len, reverse=True):
+        if path.endswith('.' + report_format):
+            return report_format
+    raise ValueError(f"Не удалось определить формат отчета по имени файла: {path}")
+
+
+def safe_file_name(group_name):
+    return re.sub(r'[\\/:*?"<>|]', '_', group_name)
+
+
+def open_report(file, report_format, mode='w'):
+    """Открыть файл отчета как текстовый: with open_report(path, 'jsonl.gz') as f: ...
+
+    Для форматов *.gz file может быть и открытым двоичным файлом (например, sys.stdout.buffer).
+    """
+    _layout(report_format)
+    if report_format.endswith('.gz'):
+        return gzip.open(file, mode + 't', compresslevel=REPORT_COMPRESSLEVEL, encoding='utf-8')
+    return open(file, mode, encoding='utf-8')
+
+
+def write_group_report(db, group_name, fp, report_format='json', include_archive=False, start=None, end=None):
+    """Потоково записать отчет группы в открытый текстовый файл.
+
+    Студенты читаются из базы и записываются по одному, статистика группы
+    накапливается по ходу и выводится в конце, поэтому расход памяти не
+    зависит от размера группы.
+
+    json  - компактный JSON той же структуры, что и get_group_detailed_info;
+    jsonl - JSON Lines: строка header, по строке на студента, строка group_statistics;
+    json.gz, jsonl.gz - то же самое, fp открывается через open_report.
+    include_archive - по всем семестрам, включая архивные (archive.py);
+    start, end - только за период, например семестр (даты 'YYYY-MM-DD' включительно).
+    Возвращает статистику группы.
+    """
+    layout = _layout(report_format)
+    report_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    statistics = GroupStatistics()
+
+    if layout == 'json':
+        fp.write(f'{{"group_name":{_dumps(group_name)},"report_date":{_dumps(report_date)},"students":[')
+    else:
+        fp.write(_dumps({'type': 'header', 'group_name': group_name, 'report_date': report_date}) + '\n')
+
+    for index, student in enumerate(db.iter_group_student_reports(group_name, include_archive, start, end)):
+        statistics.add(student['overall_statistics'])
+        if layout == 'json':
+            fp.write((',' if index else '') + _dumps(student))
+        else:
+            fp.write(_dumps({'type': 'student', **student}) + '\n')
+
+    group_statistics = statistics.result()
+
+    if layout == 'json':
+        fp.write(f'],"group_statistics":{_dumps(group_statistics)}}}')
+    else:
+        fp.write(_dumps({'type': 'group_statistics', **group_statistics}) + '\n')
+
+    return group_statistics
+
+
+def write_groups_report(db, fp, report_format='json', group_names=None):
+    """Записать отчеты нескольких групп (по умолчанию всех) в открытый текстовый файл.
+
+    Отчеты собираются get_groups_detailed_info: у ShardedDatabase - из
+    шардов параллельно. json - список отчетов групп, jsonl - по отчету на строку.
+    Возвращает число групп.
+    """
+    layout = _layout(report_format)
+    reports = db.get_groups_detailed_info(group_names)
+
+    if layout == 'json':
+        fp.write(_dumps(reports))
+    else:
+        for report in reports:
+            fp.write(_dumps(report) + '\n')
+
+    return len(reports)
+
+
+def write_group_delta(db, group_name, fp, after=None, report_format='json'):
+    """Записать выгрузку изменений группы после номера журнала after (см. Database.get_group_delta).
+
+    json  - объект с полями since, sequence, grades, attendance и students;
+    jsonl - строка header, по строке на каждую оценку (grade), отметку
+            (attendance) и отчет затронутого студента (student).
+    Без after выгружается все текущее состояние группы.
+    Возвращает выгрузку; ее sequence - водяной знак для следующей выгрузки.
+    """
+    layout = _layout(report_format)
+    delta = db.get_group_delta(group_name, after)
+    header = {
+        'group_name': group_name,
+        'report_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'since': delta['since'],
+        'sequence': delta['sequence'],
+    }
+
+    if layout == 'json':
+        fp.write(_dumps({
+            **header,
+            'grades': [row._asdict() for row in delta['grades']],
+            'attendance': [row._asdict() for row in delta['attendance']],
+            'students': delta['students'],
+        }))
+    else:
+        fp.write(_dumps({'type': 'header', **header}) + '\n')
+        for row in delta['grades']:
+            fp.write(_dumps({'type': 'grade', **row._asdict()}) + '\n')
+        for row in delta['attendance']:
+            fp.write(_dumps({'type': 'attendance', **row._asdict()}) + '\n')
+        for student in delta['students']:
+            fp.write(_dumps({'type': 'student', **student}) + '\n')
+
+    return delta
+
+
+def export_group_delta(db, group_name, fp, consumer, report_format='json'):
+    """Выгрузить потребителю consumer изменения группы с его прошлой выгрузки.
+
+    Водяной знак сохраняется только после записи всей выгрузки: если она
+    прервалась, следующая выгрузка повторит те же изменения.
+    """
+    delta = write_group_delta(db, group_name, fp, db.get_watermark(consumer, group_name), report_format)
+    fp.flush()
+    db.set_watermark(consumer, group_name, delta['sequence'])
+    return delta
+
+
+def read_group_report(path, report_format=None):
+    """Прочитать отчет группы, записанный write_group_report, в словарь как у get_group_detailed_info.
+
+    report_format по умолчанию определяется по расширению файла.
+    """
+    report_format = report_format or report_format_of(path)
+    with open_report(path, report_format, 'r') as f:
+        if _layout(report_format) == 'json':
+            return json.load(f)
+
+        header = {}
+        students = []
+        group_statistics = {}
+        for line in f:
+            record = json.loads(line)
+            record_type = record.pop('type')
+            if record_type == 'header':
+                header = record
+            elif record_type == 'student':
+                students.append(record)
+            elif record_type == 'group_statistics':
+                group_statistics = record
+
+    return {**header, 'students': students, 'group_statistics': group_statistics}
+
+
+def cached_group_report(db, group_name, report_format='json.gz', cache_dir=REPORT_CACHE_DIR):
+    """Файл отчета группы из дискового кэша: (путь, взят ли готовый файл).
+
+    Файл лежит в подкаталоге базы (Database.get_database_id) и называется
+    по группе, версии ее данных (Database.get_group_version) и формату. Пока данные группы не менялись, повторный запрос отдает
+    готовый файл без чтения отчетов. Версия читается до построения отчета:
+    если группа изменилась во время построения, текущая версия уже больше,
+    и такой файл никогда не будет отдан. Файлы прежних версий удаляются.
+    Отчеты по архивам и за период не кэшируются.
+    """
+    cache_dir = os.path.join(cache_dir, db.get_database_id())
+    stem = f"group_report_{safe_file_name(group_name)}"
+    version = db.get_group_version(group_name)
+    path = os.path.join(cache_dir, f"{stem}_v{version}.{report_format}")
+    if os.path.exists(path):
+        return path, True
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Файл появляется в кэше целиком: пишется во временный и переименовывается
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open_report(partial, report_format) as f:
+            write_group_report(db, group_name, f, report_format)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    # Файлы прежних версий больше не будут отданы; другой процесс мог удалить их раньше
+    previous = re.compile(rf"{re.escape(stem)}_v(\d+)\.{re.escape(report_format)}")
+    for name in os.listdir(cache_dir):
+        match = previous.fullmatch(name)
+        if match and int(match.group(1)) < version:
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(cache_dir, name))
+
+    return path, False
+
+
+def _open_output(output, report_format):
+    """Файл отчета для записи; без output - stdout"""
+    if output:
+        return open_report(output, report_format)
+    if report_format.endswith('.gz'):
+        return open_report(sys.stdout.buffer, report_format)
+    return nullcontext(sys.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковый отчет группы")
+    parser.add_argument('group', nargs='?', help="название группы (без него - отчет по всем группам)")
+    parser.add_argument('-f', '--format', choices=REPORT_FORMATS,
+                        help="формат отчета (по умолчанию по расширению файла отчета, иначе json)")
+    parser.add_argument('-o', '--output', help="файл отчета (по умолчанию stdout)")
+    parser.add_argument('--include-archive', action='store_true', help="включить архивные семестры")
+    parser.add_argument('--start', help="начало периода (YYYY-MM-DD)")
+    parser.add_argument('--end', help="конец периода включительно (YYYY-MM-DD)")
+    parser.add_argument('--consumer',
+                        help="выгрузить только изменения с прошлой выгрузки этому потребителю "
+                             "(первая выгрузка - полная)")
+    parser.add_argument('--cache', action='store_true',
+                        help="взять готовый файл из кэша, если данные группы не менялись")
+    parser.add_argument('--cache-dir', default=REPORT_CACHE_DIR, help="каталог кэша отчетов")
+    parser.add_argument('--db', default="academic_system.db")
+    args = parser.parse_args(argv)
+
+    if args.format is None:
+        try:
+            args.format = report_format_of(args.output) if args.output else 'json'
+        except ValueError:
+            args.format = 'json'
+
+    db = get_database(args.db)
+
+    if args.group is None:
+        if args.consumer or args.include_archive or args.start or args.end or args.cache:
+            parser.error("отчет по всем группам несовместим с --consumer, --include-archive, --start, --end и --cache")
+        with _open_output(args.output, args.format) as f:
+            groups = write_groups_report(db, f, args.format)
+        if args.output:
+            print(f"Отчеты групп сохранены в файл: {args.output}")
+            print(f"- Количество групп: {groups}")
+        return
+
+    if args.consumer:
+        if args.include_archive or args.start or args.end or args.cache:
+            parser.error("--consumer несовместим с --include-archive, --start, --end и --cache")
+        with _open_output(args.output, args.format) as f:
+            delta = export_group_delta(db, args.group, f, args.consumer, args.format)
+        if args.output:
+            print(f"Изменения группы сохранены в файл: {args.output}")
+            print(f"- Оценок: {len(delta['grades'])}, отметок: {len(delta['attendance'])}, "
+                  f"студентов: {len(delta['students'])}, номер журнала: {delta['sequence']}")
+        return
+
+    if args.cache:
+        if args.include_archive or args.start or args.end:
+            parser.error("--cache несовместим с --include-archive, --start и --end")
+        path, cached = cached_group_report(db, args.group, args.format, args.cache_dir)
+        if args.output:
+            shutil.copyfile(path, args.output)
+            print(f"Отчет группы {'взят из кэша' if cached else 'сохранен'} в файл: {args.output}")
+        else:
+            with open(path, 'rb') as f:
+                sys.stdout.flush()
+                shutil.copyfileobj(f, sys.stdout.buffer)
+        return
+
+    with _open_output(args.output, args.format) as f:
+        statistics = write_group_report(db, args.group, f, args.format, args.include_archive,
+                                        args.start, args.end)
+    if args.output:
+        print(f"Отчет группы сохранен в файл: {args.output}")
+        print(f"- Количество студентов: {statistics.get('total_students', 0)}")
+
+
+if __name__ == "__main__":
+    main()
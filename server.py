@@ -0,0 +1,342 @@
+import argparse
+import asyncio
+import json
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from database import open_database
+
+MAX_BODY_SIZE = 1024 * 1024
+
+# Поля записей POST /grades и /attendance: (тип JSON-значения, описание для ошибки)
+RECORD_FIELDS = {
+    'student_id': (int, "целым числом"),
+    'subject': (str, "строкой"),
+    'grade': (int, "целым числом"),
+    'teacher_name': (str, "строкой"),
+    'present': (bool, "true или false"),
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AcademicService:
+    """Локальный JSON-сервис поверх методов Database.
+
+    Запросы обслуживаются в одном цикле asyncio, а блокирующая работа с
+    SQLite уходит в пулы потоков: несколько читателей и один писатель
+    (SQLite допускает только одну пишущую транзакцию за раз).
+    """
+
+    def __init__(self, db, readers=8):
+        self.db = db
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-read')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+        self.sessions = {}
+        self.routes = [
+            ('POST', r'/login', self.login, 'read', False),
+            ('GET', r'/subjects', self.subjects, 'read', True),
+            ('GET', r'/students/(\d+)/grades', self.student_grades, 'read', True),
+            ('GET', r'/students/(\d+)/attendance', self.student_attendance, 'read', True),
+            ('GET', r'/students/(\d+)/report', self.student_report, 'read', True),
+            ('GET', r'/groups/([^/]+)/students', self.group_students, 'read', True),
+            ('GET', r'/groups/([^/]+)/grades', self.group_grades, 'read', True),
+            ('GET', r'/groups/([^/]+)/statistics', self.group_statistics, 'read', True),
+            ('GET', r'/groups/([^/]+)/report', self.group_report, 'read', True),
+            ('POST', r'/grades', self.add_grades, 'write', True),
+            ('POST', r'/attendance', self.add_attendance, 'write', True),
+        ]
+
+    # Обработчики: выполняются в пуле потоков, возвращают JSON-совместимый объект
+
+    def login(self, user, args, query, body):
+        username, password = body.get('username'), body.get('password')
+        if not isinstance(username, str) or not isinstance(password, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "username и password должны быть строками")
+        user = self.db.authenticate_user(username, password)
+        if not user:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Неверный логин или пароль")
+
+        token = secrets.token_hex(16)
+        self.sessions[token] = user
+        return {'token': token, 'user': user}
+
+    def subjects(self, user, args, query, body):
+        return {'subjects': self.db.get_subjects()}
+
+    def student_grades(self, user, args, query, body):
+        student_id = self._student_access(user, int(args[0]))
+        limit, after = self._page_args(query, date_key=True)
+        grades, cursor = self.db.get_student_grades_page(student_id, limit, after)
+        return {
+            'grades': [
+                {'subject': subject, 'grade': grade, 'date': date, 'teacher': teacher}
+                for subject, grade, date, teacher in grades
+            ],
+            'next': self._cursor(cursor)
+        }
+
+    def student_attendance(self, user, args, query, body):
+        student_id = self._student_access(user, int(args[0]))
+        limit, after = self._page_args(query, date_key=True)
+        attendance, cursor = self.db.get_student_attendance_page(student_id, limit, after)
+        present, total = self.db.get_student_attendance_totals(student_id)
+        return {
+            'attendance': [
+                {'subject': subject, 'date': date, 'present': bool(present)}
+                for subject, date, present in attendance
+            ],
+            'next': self._cursor(cursor),
+            'attendance_rate': (present / total) * 100 if total else 0
+        }
+
+    def student_report(self, user, args, query, body):
+        return self.db.get_student_detailed_info(self._student_access(user, int(args[0])))
+
+    def group_students(self, user, args, query, body):
+        students = self.db.get_group_students(self._group_access(user, args[0]))
+        return {
+            'students': [
+                {'id': student_id, 'full_name': full_name, 'username': username}
+                for student_id, full_name, username in students
+            ]
+        }
+
+    def group_grades(self, user, args, query, body):
+        group_name = self._group_access(user, args[0])
+        limit, after = self._page_args(query)
+        grades, cursor = self.db.get_group_grades_page(group_name, limit, after)
+        return {
+            'grades': [
+                {'student': student, 'subject': subject, 'grade': grade, 'date': date, 'teacher': teacher}
+                for student, subject, grade, date, teacher in grades
+            ],
+            'next': self._cursor(cursor)
+        }
+
+    def group_statistics(self, user, args, query, body):
+        statistics = self.db.get_group_grade_statistics(self._group_access(user, args[0]))
+        return statistics or {}
+
+    def group_report(self, user, args, query, body):
+        return self.db.get_group_detailed_info(self._group_access(user, args[0]))
+
+    def add_grades(self, user, args, query, body):
+        records = self._write_records(user, body, ('student_id', 'subject', 'grade', 'teacher_name'))
+        for record in records:
+            if record[2] < 2 or record[2] > 5:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Оценка должна быть от 2 до 5")
+        inserted, failures = self.db.add_grades_batch(records)
+        return self._write_result(inserted, failures)
+
+    def add_attendance(self, user, args, query, body):
+        records = self._write_records(user, body, ('student_id', 'subject', 'present'))
+        inserted, failures = self.db.add_attendance_batch(records)
+        return self._write_result(inserted, failures)
+
+    # Проверки доступа и разбор параметров
+
+    def _student_access(self, user, student_id):
+        if user['role'] == 'student' and user['id'] == student_id:
+            return student_id
+        if user['role'] == 'headman' and student_id in self._group_student_ids(user['group_name']):
+            return student_id
+        raise HTTPError(HTTPStatus.FORBIDDEN, "Нет доступа к данным студента")
+
+    def _group_access(self, user, group_name):
+        group_name = unquote(group_name)
+        if user['role'] != 'headman' or user['group_name'] != group_name:
+            raise HTTPError(HTTPStatus.FORBIDDEN, "Нет доступа к данным группы")
+        return group_name
+
+    def _group_student_ids(self, group_name):
+        return {student_id for student_id, _, _ in self.db.get_group_students(group_name)}
+
+    def _write_records(self, user, body, fields):
+        if user['role'] != 'headman':
+            raise HTTPError(HTTPStatus.FORBIDDEN, "Изменять данные может только староста")
+
+        items = body.get('records', [body])
+        if not isinstance(items, list):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "records должен быть списком")
+
+        group_ids = self._group_student_ids(user['group_name'])
+        records = []
+        for item in items:
+            if not isinstance(item, dict) or any(field not in item for field in fields):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Каждая запись должна содержать: {', '.join(fields)}")
+            for field in fields:
+                expected, description = RECORD_FIELDS[field]
+                # bool - подкласс int: true не должен сойти за id студента или оценку
+                if not isinstance(item[field], expected) or expected is int and isinstance(item[field], bool):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, f"{field} должен быть {description}")
+            if item['student_id'] not in group_ids:
+                raise HTTPError(HTTPStatus.FORBIDDEN, f"Студент {item['student_id']} не из вашей группы")
+            records.append(tuple(item[field] for field in fields))
+        return records
+
+    @staticmethod
+    def _write_result(inserted, failures):
+        return {
+            'inserted': inserted,
+            'failures': [{'index': index, 'reason': reason} for index, record, reason in failures]
+        }
+
+    @staticmethod
+    def _cursor(cursor):
+        # Курсор передается обратно в параметрах after_key и after_id
+        return None if cursor is None else {'after_key': cursor[0], 'after_id': cursor[1]}
+
+    @staticmethod
+    def _page_args(query, date_key=False):
+        # date_key - курсор истории: after_key - дата 'YYYY-MM-DD'
+        try:
+            limit = min(int(query.get('limit', ['20'])[0]), 500)
+            if limit < 1:
+                raise ValueError(limit)
+            after = (query['after_key'][0], int(query['after_id'][0])) if 'after_key' in query else None
+            if after is not None and date_key:
+                date.fromisoformat(after[0])
+        except (KeyError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Неверные параметры страницы")
+        return limit, after
+
+    # HTTP
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        for route_method, pattern, handler, kind, needs_auth in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if match is None:
+                continue
+            if route_method != method:
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Метод не поддерживается")
+
+            user = None
+            if needs_auth:
+                token = headers.get('authorization', '').removeprefix('Bearer ').strip()
+                user = self.sessions.get(token)
+                if user is None:
+                    raise HTTPError(HTTPStatus.UNAUTHORIZED, "Требуется вход")
+
+            try:
+                payload = json.loads(body) if body else {}
+            except json.JSONDecodeError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть JSON")
+            if not isinstance(payload, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть JSON-объектом")
+
+            executor = self.writer if kind == 'write' else self.readers
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                executor, handler, user, match.groups(), parse_qs(url.query), payload
+            )
+
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Не найдено")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Неверный запрос"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Без длины тела нельзя найти начало следующего запроса - соединение закрывается
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Неверный Content-Length"}, False)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Слишком большой запрос"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = HTTPStatus.OK, await self.dispatch(method, target, headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+    def close(self):
+        self.readers.shutdown()
+        self.writer.shutdown()
+
+
+async def serve(db_name, host, port, readers):
+    # Соединений в пуле хватает на всех читателей и писателя
+    db = open_database(db_name, pool_size=readers + 1)
+    service = AcademicService(db, readers)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+
+    print(f"Сервис запущен на http://{host}:{port} (читателей: {readers})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный HTTP/JSON сервис системы мониторинга")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--readers', type=int, default=8, help="потоков для чтения из базы")
+    parser.add_argument('--db', default="academic_system.db", help="файл базы или каталог шардов")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.readers))
+    except KeyboardInterrupt:
+        print("\nСервис остановлен.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,584 @@
+"""Хранилище, разбитое на отдельные файлы SQLite (шарды) по группам.
+
+Каталог (catalog.db) хранит, какой группе какой шард принадлежит, и
+выдает пользователям сквозные id; сами пользователи, оценки и
+посещаемость лежат в шардах - обычных базах Database. ShardedDatabase
+повторяет публичные методы Database и направляет каждый вызов в шард
+нужной группы, поэтому запись в разные группы идет параллельно, а
+межгрупповые отчеты собираются из всех шардов.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database import Database, connect
+from instrumentation import Instrumentation
+from migrations import DATABASE_ID_SQL, DEFAULT_SUBJECTS
+from models import AttendanceTrendRecord, attendance_columns, grade_columns, group_grade_columns
+from pool import ConnectionPool
+
+CATALOG_NAME = "catalog.db"
+
+_CATALOG_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS shards (
+        name TEXT PRIMARY KEY,
+        path TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS groups (
+        group_name TEXT PRIMARY KEY,
+        shard TEXT NOT NULL REFERENCES shards (name)
+    )
+    ''',
+    # id пользователей выдает каталог: они уникальны во всех шардах сразу
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        group_name TEXT NOT NULL REFERENCES groups (group_name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS subjects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''',
+    # Идентификатор хранилища: ключ готовых файлов отчетов (см. Database.get_database_id)
+    "CREATE TABLE IF NOT EXISTS catalog_info (id TEXT NOT NULL)",
+    DATABASE_ID_SQL.format(table='catalog_info'),
+)
+
+
+def shard_name(group_name):
+    """Имя шарда группы по умолчанию - название группы, пригодное для имени файла"""
+    return re.sub(r'[^\w-]+', '_', group_name).strip('_') or 'group'
+
+
+class ShardedDatabase:
+    """Database, распределенная по шардам.
+
+    shard_of(group_name) выбирает шард для новой группы: по умолчанию у
+    каждой группы свой файл, а, например, lambda group: 'ФИТ' сложит все
+    группы факультета в один шард. Остальные параметры передаются
+    каждому шарду.
+    """
+
+    def __init__(self, directory, shard_of=shard_name, pool_size=5, report_cache_size=1024,
+                 read_only=False, write_behind=False):
+        self.directory = directory
+        self.shard_of = shard_of
+        self.read_only = read_only
+        self.shard_options = {
+            'pool_size': pool_size,
+            'report_cache_size': report_cache_size,
+            'read_only': read_only,
+            'write_behind': write_behind,
+        }
+        self.instrumentation = None
+        self.catalog_path = os.path.join(directory, CATALOG_NAME)
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+
+        self.catalog = ConnectionPool(lambda: connect(self.catalog_path, read_only), size=pool_size)
+        self._shards = {}
+        self._group_shards = {}
+        self._user_groups = {}
+        self._lock = threading.Lock()
+
+        if not read_only:
+            with self.catalog.connection() as conn:
+                for statement in _CATALOG_SCHEMA:
+                    conn.execute(statement)
+                conn.executemany("INSERT OR IGNORE INTO subjects (name) VALUES (?)",
+                                 [(name,) for name in DEFAULT_SUBJECTS])
+                conn.commit()
+
+    # Шарды
+
+    def shard(self, name):
+        """Открытый шард по имени (открывается при первом обращении)"""
+        with self._lock:
+            db = self._shards.get(name)
+            if db is None:
+                with self.catalog.connection() as conn:
+                    row = conn.execute("SELECT path FROM shards WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    raise KeyError(f"Неизвестный шард: {name}")
+                db = self._shards[name] = Database(os.path.join(self.directory, row[0]), **self.shard_options)
+                if self.instrumentation is not None:
+                    db.enable_instrumentation(self.instrumentation)
+            return db
+
+    def shard_names(self):
+        with self.catalog.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT name FROM shards ORDER BY name")]
+
+    def shards(self):
+        """Все шарды: [(имя, Database)]"""
+        return [(name, self.shard(name)) for name in self.shard_names()]
+
+    def shard_for_group(self, group_name):
+        """Шард группы или None, если такой группы нет"""
+        name = self._group_shards.get(group_name)
+        if name is None:
+            with self.catalog.connection() as conn:
+                row = conn.execute("SELECT shard FROM groups WHERE group_name = ?", (group_name,)).fetchone()
+            if row is None:
+                return None
+            name = self._group_shards[group_name] = row[0]
+        return self.shard(name)
+
+    def shard_for_student(self, student_id):
+        """Шард пользователя по его id или None"""
+        group_name = self._user_groups.get(student_id)
+        if group_name is None:
+            with self.catalog.connection() as conn:
+                row = conn.execute("SELECT group_name FROM users WHERE id = ?", (student_id,)).fetchone()
+            if row is None:
+                return None
+            group_name = self._user_groups[student_id] = row[0]
+        return self.shard_for_group(group_name)
+
+    def assign_group(self, group_name, shard=None):
+        """Закрепить группу за шардом (по умолчанию shard_of(group_name)) и вернуть его"""
+        existing = self.shard_for_group(group_name)
+        if existing is not None:
+            return existing
+
+        shard = shard or self.shard_of(group_name)
+        with self.catalog.connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO shards (name, path) VALUES (?, ?)", (shard, f"{shard}.db"))
+            conn.execute("INSERT OR IGNORE INTO groups (group_name, shard) VALUES (?, ?)", (group_name, shard))
+            conn.commit()
+            subjects = [row[0] for row in conn.execute("SELECT name FROM subjects ORDER BY id")]
+
+        db = self.shard_for_group(group_name)
+        # В новом шарде должен быть весь справочник предметов
+        known = set(db.get_subjects())
+        for subject in subjects:
+            if subject not in known:
+                db.add_subject(subject)
+        return db
+
+    def _fan_out(self, function, shards=None):
+        """Выполнить function(db) во всех шардах параллельно, результаты - в порядке шардов"""
+        shards = [db for _, db in self.shards()] if shards is None else shards
+        if len(shards) <= 1:
+            return [function(db) for db in shards]
+        with ThreadPoolExecutor(max_workers=min(len(shards), 8)) as pool:
+            return list(pool.map(function, shards))
+
+    # Жизненный цикл
+
+    def close(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for db in shards:
+            db.close()
+        self.catalog.close()
+
+    @property
+    def closed(self):
+        return self.catalog.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def enable_instrumentation(self, instrumentation=None, **options):
+        """Общая статистика по всем шардам (см. Database.enable_instrumentation)"""
+        self.instrumentation = instrumentation or Instrumentation(**options)
+        with self._lock:
+            shards = list(self._shards.values())
+        for db in shards:
+            db.enable_instrumentation(self.instrumentation)
+        return self.instrumentation
+
+    def disable_instrumentation(self):
+        self.instrumentation = None
+        with self._lock:
+            shards = list(self._shards.values())
+        for db in shards:
+            db.disable_instrumentation()
+
+    def flush(self, timeout=None):
+        self._fan_out(lambda db: db.flush(timeout))
+
+    def rebuild_summaries(self):
+        self._fan_out(Database.rebuild_summaries)
+
+    def clear_report_cache(self):
+        self._fan_out(Database.clear_report_cache)
+
+    # Пользователи
+
+    def add_user(self, username, password, full_name, role, group_name):
+        """Добавить пользователя: id выдает каталог, запись попадает в шард группы"""
+        db = self.assign_group(group_name)
+        with self.catalog.connection() as conn:
+            cursor = conn.execute("INSERT INTO users (username, group_name) VALUES (?, ?)", (username, group_name))
+            user_id = cursor.lastrowid
+            conn.commit()
+
+        try:
+            with db.connection() as conn:
+                conn.execute('''
+                    INSERT INTO users (id, username, password, full_name, role, group_name)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, username, password, full_name, role, group_name))
+                conn.commit()
+        except sqlite3.Error:
+            with self.catalog.connection() as conn:
+                conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+                conn.commit()
+            raise
+
+        self._user_groups[user_id] = group_name
+        return user_id
+
+    def seed_test_data(self):
+        """Добавить тестовые учетные записи, как Database.seed_test_data"""
+        for username, password, full_name, role, group_name in (
+            ('student1', '123456', 'Иванов Иван Иванович', 'student', 'Группа 101'),
+            ('student2', '123456', 'Петров Петр Петрович', 'student', 'Группа 101'),
+            ('headman1', '123456', 'Сидоров Алексей', 'headman', 'Группа 101'),
+        ):
+            try:
+                self.add_user(username, password, full_name, role, group_name)
+            except sqlite3.IntegrityError:
+                pass
+
+    def authenticate_user(self, username, password):
+        with self.catalog.connection() as conn:
+            row = conn.execute("SELECT group_name FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return self.shard_for_group(row[0]).authenticate_user(username, password)
+
+    # Данные студента: вызов уходит в шард его группы
+
+    def _student_call(self, student_id, method, default, *args):
+        db = self.shard_for_student(student_id)
+        if db is None:
+            return default
+        return getattr(db, method)(student_id, *args)
+
+    def get_student_grades(self, student_id, include_archive=False, start=None, end=None):
+        return self._student_call(student_id, 'get_student_grades', grade_columns(), include_archive, start, end)
+
+    def get_student_attendance(self, student_id, include_archive=False, start=None, end=None):
+        return self._student_call(
+            student_id, 'get_student_attendance', attendance_columns(), include_archive, start, end
+        )
+
+    def get_student_grades_page(self, student_id, limit=10, after=None):
+        return self._student_call(student_id, 'get_student_grades_page', ([], None), limit, after)
+
+    def get_student_attendance_page(self, student_id, limit=10, after=None):
+        return self._student_call(student_id, 'get_student_attendance_page', ([], None), limit, after)
+
+    def get_student_attendance_totals(self, student_id):
+        return self._student_call(student_id, 'get_student_attendance_totals', (None, 0))
+
+    def get_student_subject_averages(self, student_id):
+        return self._student_call(student_id, 'get_student_subject_averages', [])
+
+    def get_student_detailed_info(self, student_id, include_archive=False, start=None, end=None):
+        return self._student_call(student_id, 'get_student_detailed_info', None, include_archive, start, end)
+
+    def add_grade(self, student_id, subject_name, grade, teacher_name):
+        return self._student_call(student_id, 'add_grade', False, subject_name, grade, teacher_name)
+
+    def add_attendance(self, student_id, subject_name, present):
+        return self._student_call(student_id, 'add_attendance', False, subject_name, present)
+
+    def submit_grade(self, student_id, subject_name, grade, teacher_name):
+        db = self.shard_for_student(student_id)
+        if db is None:
+            raise KeyError(f"Неизвестный студент: {student_id}")
+        return db.submit_grade(student_id, subject_name, grade, teacher_name)
+
+    def submit_attendance(self, student_id, subject_name, present):
+        db = self.shard_for_student(student_id)
+        if db is None:
+            raise KeyError(f"Неизвестный студент: {student_id}")
+        return db.submit_attendance(student_id, subject_name, present)
+
+    def _batch(self, method, records):
+        """Разложить пачку по шардам, записать параллельно и собрать результат с исходными индексами"""
+        by_shard = {}
+        failures = []
+        for index, record in enumerate(records):
+            try:
+                db = self.shard_for_student(record[0])
+            except (TypeError, IndexError):
+                failures.append((index, record, "Неверный формат записи"))
+                continue
+            if db is None:
+                failures.append((index, record, f"Неизвестный студент: {record[0]}"))
+                continue
+            by_shard.setdefault(db, []).append((index, record))
+
+        def write(db):
+            items = by_shard[db]
+            return items, getattr(db, method)(record for _, record in items)
+
+        inserted = 0
+        for items, (count, shard_failures) in self._fan_out(write, list(by_shard)):
+            inserted += count
+            failures.extend((items[position][0], record, reason) for position, record, reason in shard_failures)
+
+        failures.sort(key=lambda failure: failure[0])
+        return inserted, failures
+
+    def add_grades_batch(self, records):
+        return self._batch('add_grades_batch', records)
+
+    def add_attendance_batch(self, records):
+        return self._batch('add_attendance_batch', records)
+
+    # Данные группы: вызов уходит в шард группы
+
+    def _group_call(self, group_name, method, default, *args):
+        db = self.shard_for_group(group_name)
+        if db is None:
+            return default
+        return getattr(db, method)(group_name, *args)
+
+    def get_group_names(self):
+        with self.catalog.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT group_name FROM groups ORDER BY group_name")]
+
+    def get_group_students(self, group_name):
+        return self._group_call(group_name, 'get_group_students', [])
+
+    def get_group_grades(self, group_name, start=None, end=None):
+        return self._group_call(group_name, 'get_group_grades', group_grade_columns(), start, end)
+
+    def get_group_grades_page(self, group_name, limit=10, after=None):
+        return self._group_call(group_name, 'get_group_grades_page', ([], None), limit, after)
+
+    def get_group_grade_statistics(self, group_name):
+        return self._group_call(group_name, 'get_group_grade_statistics', None)
+
+    def get_group_detailed_info(self, group_name, include_archive=False, start=None, end=None):
+        db = self.shard_for_group(group_name)
+        if db is None:
+            # Такой же пустой отчет, как у Database для группы без студентов
+            return {
+                'group_name': group_name,
+                'report_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'students': [],
+                'group_statistics': {}
+            }
+        return db.get_group_detailed_info(group_name, include_archive, start, end)
+
+    def iter_group_student_reports(self, group_name, include_archive=False, start=None, end=None):
+        db = self.shard_for_group(group_name)
+        if db is not None:
+            yield from db.iter_group_student_reports(group_name, include_archive, start, end)
+
+    def get_group_delta(self, group_name, after=None):
+        db = self.shard_for_group(group_name)
+        if db is None:
+            return {'group_name': group_name, 'since': after, 'sequence': 0,
+                    'grades': [], 'attendance': [], 'students': []}
+        # Номера журнала у каждого шарда свои, водяные знаки хранятся в шарде группы
+        return db.get_group_delta(group_name, after)
+
+    def get_database_id(self):
+        """Идентификатор хранилища из каталога; версии групп хранятся в их шардах"""
+        with self.catalog.connection() as conn:
+            return conn.execute("SELECT id FROM catalog_info").fetchone()[0]
+
+    def get_group_version(self, group_name):
+        return self._group_call(group_name, 'get_group_version', 0)
+
+    def get_watermark(self, consumer, group_name):
+        db = self.shard_for_group(group_name)
+        return db.get_watermark(consumer, group_name) if db is not None else None
+
+    def set_watermark(self, consumer, group_name, sequence):
+        db = self.shard_for_group(group_name)
+        if db is None:
+            raise KeyError(f"Неизвестная группа: {group_name}")
+        db.set_watermark(consumer, group_name, sequence)
+
+    def get_attendance_trend(self, period='week', student_id=None, subject=None, group_name=None,
+                             start=None, end=None, include_archive=False):
+        """Ряд посещаемости из шарда студента или группы, по предмету и факультету - сумма рядов всех шардов"""
+        if student_id is not None:
+            shards = [self.shard_for_student(student_id)]
+        elif group_name is not None:
+            shards = [self.shard_for_group(group_name)]
+        else:
+            shards = None
+        if shards is not None:
+            shards = [db for db in shards if db is not None]
+
+        series = self._fan_out(
+            lambda db: db.get_attendance_trend(period, student_id, subject, group_name, start, end, include_archive),
+            shards
+        )
+        if len(series) == 1:
+            return series[0]
+
+        totals = {}
+        for records in series:
+            for record in records:
+                present, total = totals.get(record.period, (0, 0))
+                totals[record.period] = (present + record.present, total + record.total)
+        return [
+            AttendanceTrendRecord(period_start, present, total, present / total * 100)
+            for period_start, (present, total) in sorted(totals.items())
+        ]
+
+    def get_groups_detailed_info(self, group_names=None):
+        """Отчеты нескольких групп (по умолчанию всех), собранные из шардов параллельно"""
+        group_names = self.get_group_names() if group_names is None else list(group_names)
+        by_shard = {}
+        for group_name in group_names:
+            db = self.shard_for_group(group_name)
+            if db is not None:
+                by_shard.setdefault(db, []).append(group_name)
+
+        reports = {}
+        for shard_reports in self._fan_out(
+            lambda db: [db.get_group_detailed_info(group_name) for group_name in by_shard[db]], list(by_shard)
+        ):
+            for report in shard_reports:
+                reports[report['group_name']] = report
+
+        return [reports[group_name] for group_name in group_names if group_name in reports]
+
+    # Справочник предметов общий: хранится в каталоге и копируется во все шарды
+
+    def get_subjects(self):
+        with self.catalog.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT name FROM subjects ORDER BY id")]
+
+    def get_subject_id(self, subject_name):
+        """id предмета в каталоге (в шардах id могут отличаться)"""
+        with self.catalog.connection() as conn:
+            row = conn.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,)).fetchone()
+        return row[0] if row else None
+
+    def add_subject(self, subject_name):
+        with self.catalog.connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO subjects (name) VALUES (?)", (subject_name,))
+            conn.commit()
+        self._fan_out(lambda db: db.add_subject(subject_name))
+        return self.get_subject_id(subject_name)
+
+    def refresh_subjects(self):
+        self._fan_out(Database.refresh_subjects)
+        with self.catalog.connection() as conn:
+            return {name: subject_id for subject_id, name in conn.execute("SELECT id, name FROM subjects ORDER BY id")}
+
+
+def split_database(source_path, directory, shard_of=shard_name):
+    """Разложить обычную базу по шардам, сохранив id пользователей.
+
+    Возвращает ShardedDatabase над directory.
+    """
+    source = Database(source_path, read_only=True)
+    sharded = ShardedDatabase(directory, shard_of=shard_of)
+
+    try:
+        for subject in source.get_subjects():
+            sharded.add_subject(subject)
+
+        with source.connection() as conn:
+            users = conn.execute('''
+                SELECT id, username, password, full_name, role, group_name
+                FROM users
+                ORDER BY group_name, id
+            ''').fetchall()
+
+        with sharded.catalog.connection() as conn:
+            for group_name in sorted({user[5] for user in users}):
+                sharded.assign_group(group_name)
+            conn.executemany("INSERT INTO users (id, username, group_name) VALUES (?, ?, ?)",
+                             [(user[0], user[1], user[5]) for user in users])
+            conn.commit()
+
+        for group_name in sharded.get_group_names():
+            db = sharded.shard_for_group(group_name)
+            subjects = db.refresh_subjects()
+            group_users = [user for user in users if user[5] == group_name]
+            ids = [user[0] for user in group_users]
+
+            with source.connection() as conn, db.connection() as target:
+                target.executemany('''
+                    INSERT INTO users (id, username, password, full_name, role, group_name)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', group_users)
+
+                # id предметов в шарде могут отличаться от исходных - сопоставление по названию
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    target.executemany('''
+                        INSERT INTO grades (student_id, subject_id, grade, date, teacher_name)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (
+                        (student_id, subjects[subject], grade, date, teacher)
+                        for student_id, subject, grade, date, teacher in conn.execute(f'''
+                            SELECT g.student_id, s.name, g.grade, g.date, g.teacher_name
+                            FROM grades g JOIN subjects s ON s.id = g.subject_id
+                            WHERE g.student_id IN ({placeholders})
+                            ORDER BY g.id
+                        ''', chunk)
+                    ))
+                    target.executemany('''
+                        INSERT INTO attendance (student_id, subject_id, date, present)
+                        VALUES (?, ?, ?, ?)
+                    ''', (
+                        (student_id, subjects[subject], date, present)
+                        for student_id, subject, date, present in conn.execute(f'''
+                            SELECT a.student_id, s.name, a.date, a.present
+                            FROM attendance a JOIN subjects s ON s.id = a.subject_id
+                            WHERE a.student_id IN ({placeholders})
+                            ORDER BY a.id
+                        ''', chunk)
+                    ))
+                target.commit()
+    finally:
+        source.close()
+
+    return sharded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разбиение базы на шарды по группам")
+    parser.add_argument('source', help="исходная база")
+    parser.add_argument('directory', help="каталог для шардов (будет создан)")
+    parser.add_argument('--shard', action='append', default=[], metavar='ГРУППА=ШАРД',
+                        help="поместить группу в указанный шард (например, общий шард факультета)")
+    args = parser.parse_args(argv)
+
+    mapping = dict(item.split('=', 1) for item in args.shard)
+    with split_database(args.source, args.directory, lambda group: mapping.get(group) or shard_name(group)) as db:
+        shards = [(name, shard.db_name) for name, shard in db.shards()]
+        groups = len(db.get_group_names())
+
+    # Размеры - после закрытия, когда журнал WAL перенесен в файлы шардов
+    for name, path in shards:
+        print(f"{name}: {os.path.getsize(path) // 1024} КБ")
+    print(f"Групп: {groups}, шардов: {len(shards)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,14 @@
-from database import Database
+from database import get_database
 import json
 from datetime import datetime
 
 
 class StudentInterface:
-    def __init__(self, user_id, group_name):
-        self.db = Database()
+    # Записей истории на одной странице
+    PAGE_SIZE = 10
+
+    def __init__(self, user_id, group_name, db=None):
+        self.db = db or get_database()
         self.user_id = user_id
         self.group_name = group_name
 
@@ -35,61 +38,57 @@ class StudentInterface:
 
     def show_grades(self):
         print("\n=== ВАШИ ОЦЕНКИ ===")
-        grades = self.db.get_student_grades(self.user_id)
 
-        if not grades:
-            print("Оценок пока нет.")
-            return
+        cursor = None
+        shown = 0
+        while True:
+            grades, cursor = self.db.get_student_grades_page(self.user_id, self.PAGE_SIZE, cursor)
 
-        current_subject = ""
-        for subject, grade, date, teacher in grades:
-            if subject != current_subject:
-                current_subject = subject
-                print(f"\n{subject}:")
-            print(f"  {date}: {grade} (преп. {teacher})")
+            if not grades and not shown:
+                print("Оценок пока нет.")
+                return
+
+            for subject, grade, date, teacher in grades:
+                print(f"  {date} - {subject}: {grade} (преп. {teacher})")
+            shown += len(grades)
+
+            if cursor is None or input("Показать более ранние оценки? (y/n): ").lower() != 'y':
+                break
 
     def show_attendance(self):
         print("\n=== ВАША ПОСЕЩАЕМОСТЬ ===")
-        attendance = self.db.get_student_attendance(self.user_id)
+        present_count, total_count = self.db.get_student_attendance_totals(self.user_id)
 
-        if not attendance:
+        if not total_count:
             print("Данные о посещаемости отсутствуют.")
             return
 
-        present_count = 0
-        total_count = 0
-
         print("\nПоследние занятия:")
-        for subject, date, present in attendance[:10]:  # Показываем последние 10 записей
-            status = "Присутствовал" if present else "Отсутствовал"
-            print(f"  {date} - {subject}: {status}")
+        cursor = None
+        while True:
+            attendance, cursor = self.db.get_student_attendance_page(self.user_id, self.PAGE_SIZE, cursor)
+
+            for subject, date, present in attendance:
+                status = "Присутствовал" if present else "Отсутствовал"
+                print(f"  {date} - {subject}: {status}")
 
-            total_count += 1
-            if present:
-                present_count += 1
+            if cursor is None or input("Показать более ранние занятия? (y/n): ").lower() != 'y':
+                break
 
-        if total_count > 0:
-            attendance_rate = (present_count / total_count) * 100
-            print(f"\nОбщая посещаемость: {attendance_rate:.1f}%")
+        # Процент считается по всей истории, а не только по показанным занятиям
+        attendance_rate = (present_count / total_count) * 100
+        print(f"\nОбщая посещаемость: {attendance_rate:.1f}%")
 
     def show_average_grades(self):
         print("\n=== СРЕДНИЙ БАЛЛ ПО ПРЕДМЕТАМ ===")
-        grades = self.db.get_student_grades(self.user_id)
+        averages = self.db.get_student_subject_averages(self.user_id)
 
-        if not grades:
+        if not averages:
             print("Оценок пока нет для расчета среднего балла.")
             return
 
-        subject_grades = {}
-
-        for subject, grade, date, teacher in grades:
-            if subject not in subject_grades:
-                subject_grades[subject] = []
-            subject_grades[subject].append(grade)
-
-        for subject, grades_list in subject_grades.items():
-            average = sum(grades_list) / len(grades_list)
-            print(f"{subject}: {average:.2f} ({len(grades_list)} оценок)")
+        for subject, average, count in averages:
+            print(f"{subject}: {average:.2f} ({count} оценок)")
 
     def generate_json_report(self):
         """Формирование отчета в JSON формате"""
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+from benchmark import generate
+from plan_audit import TracingDatabase, assert_no_full_scans
+
+
+class PlanAuditTest(unittest.TestCase):
+    """Планы запросов всех замеряемых сценариев на небольшой синтетической базе"""
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.workdir.name, "audit.db")
+        generate(db_path, groups=2, students=10, subjects=3, years=1).close()
+        self.db = TracingDatabase(db_path)
+
+    def tearDown(self):
+        self.db.close()
+        self.workdir.cleanup()
+
+    def test_no_full_scans(self):
+        assert_no_full_scans(self.db)
+
+    def test_full_scan_is_reported(self):
+        # Без индексов оценок запросы по студенту читают таблицу целиком
+        with self.db.connection() as conn:
+            indexes = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'grades' AND sql IS NOT NULL"
+            )]
+            for name in indexes:
+                conn.execute(f'DROP INDEX "{name}"')
+            conn.commit()
+
+        with self.assertRaises(AssertionError):
+            assert_no_full_scans(self.db)
+
+
+if __name__ == "__main__":
+    unittest.main()
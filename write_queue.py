@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteBehindQueue:
+    """Очередь отложенной записи с групповой фиксацией.
+
+    Один поток-писатель забирает накопившиеся операции и передает их в
+    write_batch одной пачкой: не больше max_batch операций, ожидание добора
+    пачки - не дольше max_delay секунд (при 0 пачку составляют операции,
+    накопившиеся за время предыдущей записи). write_batch(operations) возвращает
+    список результатов по операциям; исключение завершает ошибкой все
+    Future пачки.
+    """
+
+    def __init__(self, write_batch, max_batch=256, max_delay=0.0):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        # daemon: поток не должен мешать завершению интерпретатора, сброс
+        # оставшихся операций выполняет close() (в том числе из atexit)
+        self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def submit(self, operation):
+        """Поставить операцию в очередь; Future завершится после фиксации пачки"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Очередь записи закрыта")
+            self._queue.put((operation, future))
+        return future
+
+    def flush(self, timeout=None):
+        """Дождаться фиксации всех операций, поставленных до вызова"""
+        if threading.current_thread() is self._thread:
+            return
+        marker = Future()
+        with self._lock:
+            if self._closed:
+                return
+            self._queue.put((None, marker))
+        marker.result(timeout)
+
+    def close(self, timeout=None):
+        """Записать оставшиеся операции и остановить поток-писатель"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+
+    def _write(self, batch):
+        markers = [future for operation, future in batch if operation is None]
+        pending = [(operation, future) for operation, future in batch if operation is not None]
+
+        if pending:
+            try:
+                results = self.write_batch([operation for operation, _ in pending])
+            except BaseException as e:
+                for _, future in pending:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(pending, results):
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+
+        for marker in markers:
+            marker.set_result(None)